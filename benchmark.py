@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import crawler
+import mock_server
+import render_manual
+from manuals import manual_for, manual_outputs
+from metrics import metrics
+from settings import DEFAULT_FORMATS, OUTPUT_FORMATS, OUTPUT_PDF
+
+# End-to-end benchmark against the local mock manual: crawls it with the real
+# crawler, renders the PDF, and compares the numbers with a stored baseline
+
+BASELINE_FILE = "benchmark_baseline.json"
+
+# How much worse than the baseline a metric may get before it counts as a
+# regression. Higher is better for throughput, lower is better for the rest
+TOLERANCE = 0.25
+HIGHER_IS_BETTER = ("topics_per_sec", "images_per_sec")
+LOWER_IS_BETTER = ("topic_load_ms", "render_seconds", "peak_rss_mb", "worker_peak_rss_mb", "pdf_bytes")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Commands that should start in well under a second, each timed as a fresh
+# process against the crawled mock manual. Crawling is not among them, it
+# has to load asyncio and a backend whatever happens
+STARTUP_COMMANDS = {
+    "--help": ["--help"],
+    "render --help": ["render", "--help"],
+    "search": ["search", "charging"],
+    "stats": ["stats"],
+}
+STARTUP_TARGET_MS = 100
+STARTUP_RUNS = 5
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # With RUSAGE_CHILDREN, the largest of the worker processes that have
+    # exited: the encode pool and the chapter renderers
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    # Linux only; elsewhere nothing is subtracted from the peak
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return 0.0
+
+
+def run_benchmark(args, work_dir, block_resources=True):
+    if args.backend == "playwright":
+        import playwright_backend
+        playwright_backend.BLOCK_RESOURCES = block_resources
+
+    metrics.reset()
+    manual = mock_server.manual_from_args(args)
+    server, url = mock_server.start_server(manual)
+    # The mock server runs in this process with every image generated up
+    # front, so the peak is reported above what it holds before the crawl
+    server_rss_mb = current_rss_mb()
+
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            start = time.perf_counter()
+            manifest = asyncio.run(crawler.retrieve_website_content(
+                url, args.concurrency, refresh=True, backend=args.backend))
+            crawler.export_bundle(url, manifest)
+            crawl_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            render_manual.render_bundle(render_jobs=args.render_jobs,
+                                        outputs=manual_outputs(manual_for(), args.format or DEFAULT_FORMATS))
+            render_seconds = time.perf_counter() - start
+
+        pdf_bytes = os.path.getsize(OUTPUT_PDF)
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+
+    if args.verbose:
+        print(log.getvalue())
+
+    topic_timing = metrics.timings["fetch_topic"]
+    results = {
+        "topics": manual.requests["topic"],
+        "images": manual.requests["image"],
+        "assets": manual.requests["asset"],
+        "bytes_transferred": manual.bytes_sent,
+        "crawl_seconds": round(crawl_seconds, 3),
+        "topic_load_ms": round(topic_timing["total_seconds"] / max(1, topic_timing["count"]) * 1000, 1),
+        "topics_per_sec": round(manual.requests["topic"] / crawl_seconds, 2),
+        "images_per_sec": round(manual.requests["image"] / crawl_seconds, 2),
+        "render_seconds": round(render_seconds, 3),
+        "peak_rss_mb": round(peak_rss_mb() - server_rss_mb, 1),
+        "worker_peak_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "pdf_bytes": pdf_bytes,
+    }
+    if args.format:
+        # Each format's own time; they overlap, so render_seconds is less
+        # than their sum
+        for output_format in args.format:
+            timing = metrics.timings[f"render_{output_format}"]
+            results[f"render_{output_format}_seconds"] = round(timing["total_seconds"], 3)
+    return results
+
+
+def startup_times(work_dir, runs=STARTUP_RUNS):
+    # Median wall-clock time of each command, from process start to exit
+    script = os.path.join(REPO_DIR, "download-manual.py")
+    times = {}
+    for name, command in STARTUP_COMMANDS.items():
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script, *command], cwd=work_dir, stdout=subprocess.DEVNULL, check=True)
+            samples.append(time.perf_counter() - start)
+        times[name] = round(statistics.median(samples) * 1000, 1)
+    return times
+
+
+def check_startup(times):
+    slow = [name for name, ms in times.items() if ms > STARTUP_TARGET_MS]
+    print(f"Startup (median of {STARTUP_RUNS} runs, target {STARTUP_TARGET_MS} ms):")
+    for name, ms in times.items():
+        print(f"  {name:<16} {ms:>8} ms {'SLOW' if name in slow else ''}")
+    return slow
+
+
+def compare(results, baseline):
+    regressions = []
+    for key in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+        if key not in baseline or not baseline[key]:
+            continue
+        change = (results[key] - baseline[key]) / baseline[key]
+        worse = change < -TOLERANCE if key in HIGHER_IS_BETTER else change > TOLERANCE
+        marker = "REGRESSION" if worse else ""
+        print(f"  {key:<16} {baseline[key]:>12} -> {results[key]:>12} ({change:+.0%}) {marker}")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def compare_blocking(args, work_dirs):
+    # Runs the crawl with and without resource blocking and prints the two
+    # side by side. Only the browser backend loads stylesheets and fonts
+    before = run_benchmark(args, work_dirs[0], block_resources=False)
+    after = run_benchmark(args, work_dirs[1], block_resources=True)
+    print(f"  {'':<18} {'not blocked':>14} {'blocked':>14}")
+    for key in ("assets", "bytes_transferred", "topic_load_ms", "topics_per_sec", "crawl_seconds"):
+        change = (after[key] - before[key]) / before[key] if before[key] else 0
+        print(f"  {key:<18} {before[key]:>14} {after[key]:>14} ({change:+.0%})")
+    return after
+
+
+def benchmark_config(args):
+    # Results are only comparable with a baseline taken under the same settings
+    config = {
+        "topics": args.topics,
+        "images_per_topic": args.images_per_topic,
+        "image_size": list(args.image_size),
+        "distinct_images": args.distinct_images,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "concurrency": args.concurrency,
+        "backend": args.backend,
+        "render_jobs": args.render_jobs,
+    }
+    if args.format:
+        config["formats"] = sorted(args.format)
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crawling and rendering against a local mock manual")
+    mock_server.add_manual_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=4, help="crawler concurrency (default: 4)")
+    parser.add_argument("--backend", choices=["http", "playwright"], default="http")
+    parser.add_argument("--render-jobs", type=int, default=1, help="PDF render processes (default: 1)")
+    parser.add_argument("--format", action="append", choices=OUTPUT_FORMATS,
+                        help="render these formats in one pass instead of only the PDF (repeatable)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help=f"baseline file (default: {BASELINE_FILE})")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--verbose", action="store_true", help="show the crawler and renderer output")
+    parser.add_argument("--compare-blocking", action="store_true",
+                        help="with --backend playwright, crawl with and without resource blocking and compare")
+    parser.add_argument("--startup", action="store_true",
+                        help=f"also time how long the non-crawl commands take to start (target {STARTUP_TARGET_MS} ms)")
+    args = parser.parse_args()
+
+    # The mock server reads menu.html relative to the repository
+    os.chdir(REPO_DIR)
+    # Each run starts from an empty cache
+    work_dirs = [tempfile.mkdtemp(prefix="fisker-benchmark-") for _ in range(2)]
+    try:
+        if args.compare_blocking:
+            results = compare_blocking(args, work_dirs)
+        else:
+            results = run_benchmark(args, work_dirs[0])
+        startup = startup_times(work_dirs[-1 if args.compare_blocking else 0]) if args.startup else {}
+    finally:
+        for work_dir in work_dirs:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    slow = check_startup(startup) if startup else []
+
+    config = benchmark_config(args)
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    key = json.dumps(config, sort_keys=True)
+
+    if args.save_baseline:
+        baselines[key] = results
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 1 if slow else 0
+
+    if key not in baselines:
+        print(f"No baseline for these settings in {args.baseline}, run with --save-baseline to store one")
+        return 1 if slow else 0
+
+    print("Compared with baseline:")
+    regressions = compare(results, baselines[key]) + slow
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
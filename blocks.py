@@ -0,0 +1,29 @@
+import re
+
+# A topic's content as a list of blocks in document order, so the renderer
+# can lay out paragraphs, lists, tables and notes as what they are instead of
+# one long run of text. Blocks are plain lists so they store as JSON:
+#   ["paragraph", text]          text may contain "\n" for <br>
+#   ["list", ordered, [item, ...]]
+#   ["table", [[cell, ...], ...]]
+#   ["note", kind, text]         kind is "note", "warning", "caution", ...
+#   ["image", index]             index into the section's image paths
+NOTE_KINDS = ("warning", "caution", "danger", "important", "notice", "note", "tip")
+# Notes of these kinds are set apart as warnings by every output, the rest as
+# plain notes
+WARNING_KINDS = {"warning", "caution", "danger"}
+
+
+def text_blocks(text, image_count=0):
+    # For sections stored before blocks were: one paragraph per blank-line
+    # separated run of text, followed by the images
+    blocks = [["paragraph", part.strip()] for part in re.split(r"\n\s*\n", text) if part.strip()]
+    return blocks + [["image", index] for index in range(image_count)]
+
+
+def keep_images(blocks, kept):
+    # Drops image blocks whose image was not kept and renumbers the rest;
+    # kept lists the original indexes still present, in order
+    new_index = {old: new for new, old in enumerate(kept)}
+    return [["image", new_index[block[1]]] if block[0] == "image" else block
+            for block in blocks if block[0] != "image" or block[1] in new_index]
@@ -0,0 +1,225 @@
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from crawl_cache import read_json, write_json
+from settings import BROWSER_SERVICE_PORT, CACHE_DIR
+
+# A warm Chromium kept running between crawls. The service process starts
+# Chromium with a persistent profile and disk cache, checks every few seconds
+# that its DevTools endpoint still answers, and restarts it when it does not.
+# The Playwright backend attaches to it over CDP instead of launching a
+# browser of its own, so a crawl skips the browser cold start and finds the
+# manual's pages and images already in the HTTP cache
+BROWSER_DIR = os.path.join(CACHE_DIR, "browser")
+PROFILE_DIR = os.path.join(BROWSER_DIR, "profile")
+STATE_FILE = os.path.join(BROWSER_DIR, "service.json")
+LOG_FILE = os.path.join(BROWSER_DIR, "service.log")
+CLI_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "download-manual.py")
+
+DISK_CACHE_BYTES = 512 * 1024 * 1024
+
+HEALTH_CHECK_SECONDS = 5
+HEALTH_CHECK_TIMEOUT_SECONDS = 2
+# Consecutive failed checks before the browser is killed and started again
+MAX_HEALTH_FAILURES = 3
+STARTUP_TIMEOUT_SECONDS = 30
+# Pause before restarting a browser that keeps dying, doubled each time
+RESTART_BASE_SECONDS = 1
+RESTART_MAX_SECONDS = 60
+
+
+def endpoint_url(port):
+    return f"http://127.0.0.1:{port}"
+
+
+def is_healthy(port):
+    # /json/version answers as soon as Chromium accepts DevTools connections
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=HEALTH_CHECK_TIMEOUT_SECONDS)
+    try:
+        connection.request("GET", "/json/version")
+        response = connection.getresponse()
+        return response.status == 200 and "webSocketDebuggerUrl" in json.loads(response.read())
+    except Exception:
+        return False
+    finally:
+        connection.close()
+
+
+def service_endpoint():
+    # The CDP endpoint of a running service, or None. Only looks at the state
+    # file, the caller finds out soon enough if the browser does not answer
+    state = read_json(STATE_FILE)
+    if state is None or not is_process_alive(state["pid"]):
+        return None
+    return state["endpoint"]
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def chromium_executable():
+    # The Chromium that `playwright install` downloaded, so the service runs
+    # the same browser build the backend was tested with
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as playwright:
+        return playwright.chromium.executable_path
+
+
+def launch_browser(executable, port):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return subprocess.Popen([
+        executable,
+        "--headless=new",
+        f"--remote-debugging-port={port}",
+        "--remote-debugging-address=127.0.0.1",
+        f"--user-data-dir={os.path.abspath(PROFILE_DIR)}",
+        f"--disk-cache-size={DISK_CACHE_BYTES}",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "about:blank",
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_browser(browser):
+    if browser is None or browser.poll() is not None:
+        return
+    browser.terminate()
+    try:
+        browser.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        browser.kill()
+        browser.wait()
+
+
+def wait_until_healthy(port, browser=None, timeout=STARTUP_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if browser is not None and browser.poll() is not None:
+            return False
+        if is_healthy(port):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def run_service(port=BROWSER_SERVICE_PORT):
+    # Runs in the foreground until SIGTERM; `browser start` runs it in the
+    # background as `browser run`
+    executable = chromium_executable()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    state = {"pid": os.getpid(), "endpoint": endpoint_url(port), "started_at": time.time(), "restarts": 0}
+    browser = None
+    failures = 0
+    crashes = 0
+    try:
+        while True:
+            if browser is None or browser.poll() is not None:
+                if browser is not None:
+                    print(f"Browser exited with code {browser.returncode}, restarting")
+                    state["restarts"] += 1
+                    crashes += 1
+                    time.sleep(min(RESTART_MAX_SECONDS, RESTART_BASE_SECONDS * 2 ** (crashes - 1)))
+                browser = launch_browser(executable, port)
+                if not wait_until_healthy(port, browser):
+                    print(f"Browser did not answer on port {port} within {STARTUP_TIMEOUT_SECONDS}s")
+                    stop_browser(browser)
+                    continue
+                print(f"Browser {browser.pid} ready at {endpoint_url(port)}")
+                failures = 0
+                state["browser_pid"] = browser.pid
+            elif is_healthy(port):
+                failures = 0
+                crashes = 0
+            else:
+                failures += 1
+                print(f"Health check failed ({failures}/{MAX_HEALTH_FAILURES})")
+                if failures >= MAX_HEALTH_FAILURES:
+                    # Hung rather than dead; the next round starts a new one
+                    stop_browser(browser)
+                    continue
+
+            state["checked_at"] = time.time()
+            write_json(STATE_FILE, state)
+            time.sleep(HEALTH_CHECK_SECONDS)
+    finally:
+        stop_browser(browser)
+        if os.path.exists(STATE_FILE):
+            os.remove(STATE_FILE)
+        print("Browser service stopped")
+
+
+def start_service(port=BROWSER_SERVICE_PORT):
+    endpoint = service_endpoint()
+    if endpoint is not None:
+        print(f"Browser service already running at {endpoint}")
+        return 0
+
+    os.makedirs(BROWSER_DIR, exist_ok=True)
+    with open(LOG_FILE, 'a') as log:
+        # A session of its own, so the service outlives this terminal
+        process = subprocess.Popen([sys.executable, "-u", CLI_SCRIPT, "browser", "run", "--port", str(port)],
+                                   stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            print(f"Browser service exited with code {process.returncode}, see {LOG_FILE}")
+            return 1
+        if service_endpoint() is not None:
+            print(f"Browser service running at {endpoint_url(port)} (pid {process.pid})")
+            return 0
+        time.sleep(0.2)
+    print(f"Browser service did not start within {STARTUP_TIMEOUT_SECONDS}s, see {LOG_FILE}")
+    return 1
+
+
+def stop_service():
+    state = read_json(STATE_FILE)
+    if state is None or not is_process_alive(state["pid"]):
+        print("Browser service is not running")
+        return 0
+
+    os.kill(state["pid"], signal.SIGTERM)
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while is_process_alive(state["pid"]) and time.monotonic() < deadline:
+        time.sleep(0.2)
+    print("Browser service stopped")
+    return 0
+
+
+def print_status():
+    state = read_json(STATE_FILE)
+    if state is None or not is_process_alive(state["pid"]):
+        print("Browser service is not running")
+        return 1
+
+    port = int(state["endpoint"].rsplit(":", 1)[1])
+    health = "healthy" if is_healthy(port) else "not answering"
+    print(f"Browser service at {state['endpoint']}: {health}, up {time.time() - state['started_at']:.0f}s, "
+          f"{state['restarts']} restart(s), last checked {time.time() - state.get('checked_at', 0):.0f}s ago")
+    return 0 if health == "healthy" else 1
+
+
+def service_main(args):
+    if args.action == "start":
+        return start_service(args.port)
+    if args.action == "stop":
+        return stop_service()
+    if args.action == "status":
+        return print_status()
+    run_service(args.port)
+    return 0
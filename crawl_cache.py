@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urljoin
+
+from blocks import text_blocks
+from nav_index import Topic
+from settings import CACHE_DIR
+
+
+def url_key(url):
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+def content_hash(text, image_paths):
+    digest = hashlib.sha256(text.encode())
+    for image_path in image_paths:
+        with open(image_path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def write_json(path, data):
+    # Write to a temporary file first so a crash never leaves a half-written entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def manifest_path(cache_dir, root_url):
+    return os.path.join(cache_dir, "manifests", f"{url_key(root_url)}.json")
+
+
+def topic_path(cache_dir, topic_url):
+    return os.path.join(cache_dir, "topics", f"{url_key(topic_url)}.json")
+
+
+def save_manifest(cache_dir, root_url, manifest):
+    write_json(manifest_path(cache_dir, root_url), {
+        "url": root_url,
+        "saved_at": time.time(),
+        "topics": [list(topic) for topic in manifest],
+    })
+
+
+def load_manifest(cache_dir, root_url):
+    data = read_json(manifest_path(cache_dir, root_url))
+    if data is None:
+        return None
+    return [Topic(*topic) for topic in data["topics"]]
+
+
+def save_topic(cache_dir, root_url, topic, section, sources=None):
+    # sources holds what was downloaded to build the section: the topic's
+    # ETag, Last-Modified and a hash of its HTML, and the URL and validators of
+    # each image by stored path. Update runs use them for conditional requests
+    level, title, text, image_sources, blocks = section
+    sources = sources or {}
+    image_info = sources.get("images", {})
+    topic_url = urljoin(root_url, topic.url)
+    write_json(topic_path(cache_dir, topic_url), {
+        "url": topic_url,
+        "level": level,
+        "title": title,
+        "text": text,
+        "blocks": blocks,
+        "images": [dict(image_info.get(path, {}), path=path, size=os.path.getsize(path)) for path in image_sources],
+        "content_hash": content_hash(text, image_sources),
+        "etag": sources.get("etag"),
+        "last_modified": sources.get("last_modified"),
+        "source_hash": sources.get("source_hash"),
+        "fetched_at": time.time(),
+    })
+
+
+def load_topic_entry(cache_dir, root_url, topic):
+    return read_json(topic_path(cache_dir, urljoin(root_url, topic.url)))
+
+
+def save_topic_entry(cache_dir, entry):
+    write_json(topic_path(cache_dir, entry["url"]), entry)
+
+
+def load_topic(cache_dir, root_url, topic, image_dir=None):
+    entry = load_topic_entry(cache_dir, root_url, topic)
+    if entry is None:
+        return None
+
+    # An entry is only usable if every image it references is still on disk,
+    # and, given image_dir, was stored there (i.e. for the same image profile)
+    for image in entry["images"]:
+        if not os.path.exists(image["path"]) or os.path.getsize(image["path"]) != image["size"]:
+            return None
+        if image_dir is not None and os.path.dirname(image["path"]) != image_dir:
+            return None
+
+    # Entries saved before topics were split into blocks get plain paragraphs
+    blocks = entry.get("blocks") or text_blocks(entry["text"], len(entry["images"]))
+    # The title comes from the manifest: older entries hold a file-name-safe
+    # copy of it, with "_" in place of characters such as ":" and "/"
+    return (entry["level"], topic.title, entry["text"], [image["path"] for image in entry["images"]], blocks)
+
+
+def has_topic(cache_dir, root_url, topic, image_dir=None):
+    return load_topic(cache_dir, root_url, topic, image_dir) is not None
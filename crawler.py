@@ -0,0 +1,404 @@
+import asyncio
+import os
+from contextlib import AsyncExitStack
+
+import crawl_cache
+from blocks import keep_images
+from image_pipeline import ImageEncoder
+from image_store import ImageStore
+from incremental import check_for_updates, print_change_report
+from manuals import manual_for, manual_outputs
+from metrics import count, metrics, profile, span
+from nav_index import load_manifest
+from scheduler import AdaptiveLimiter
+from search_index import SearchIndexBuilder
+from section_bundle import write_bundle
+from settings import (BUNDLE_DIR, CACHE_DIR, DEDUPE_THRESHOLD, DEFAULT_BACKEND, DEFAULT_CONCURRENCY, DEFAULT_FORMATS,
+                      DEFAULT_IMAGE_PROFILE, IMAGE_DIR, SEARCH_INDEX)
+
+# Everything download-manual.py needs to fetch the manual: the crawl itself,
+# the cache, updates and the bundle export. Imported only by the commands
+# that crawl, since asyncio and the backends alone take longer to load than
+# the other commands take to run
+
+# Resolution and quality images are stored at, see IMAGE_PROFILES. Changing
+# it re-downloads the images, since only the scaled-down copies are kept
+IMAGE_PROFILE = DEFAULT_IMAGE_PROFILE
+
+# Debug flag and section limit
+DEBUG = False
+DEBUG_SECTION_LIMIT = 100
+
+async def retrieve_topic(worker, topic, image_store):
+    # Images are named by content, so the title is only ever displayed
+    section_title = topic.title
+
+    # The backend holds limiter slots and retries only around its requests.
+    # Storing the images can wait on the encode queue, which says nothing
+    # about how the server is coping
+    with span("fetch_topic", url=topic.url):
+        text, images, sources, blocks = await worker.fetch_topic(topic)
+    count("topics_fetched")
+
+    print(f"Processing: {section_title} ({topic.url})")
+    print("Content preview: {}...".format(text[:100].replace('\n', ' ')))
+
+    # Save the images
+    image_sources = []
+    # Indexes of the fetched images that were stored, for renumbering the
+    # image blocks
+    kept = []
+    encodes = []
+    sources["images"] = {}
+    for index, image in enumerate(images):
+        image_filename = f"{section_title}_{image['filename']}"
+        image_data = image['data']
+        print(f"Image data length for {image_filename}: {len(image_data)} ({image['how']})")
+        if not image_data:
+            print(f"Skipping empty image: {image_filename}")
+            count("images_empty")
+            continue
+        count("images_fetched")
+
+        # Identical images share one file, only new ones are encoded. The
+        # JPEG encode runs in the process pool, the crawler only waits here
+        # when the encode queue is full
+        with span("store_image"):
+            image_path, encode = await image_store.add(image_data)
+        if encode is None:
+            print(f"Reusing stored image: {image_path}")
+        else:
+            print(f"Saving embedded image: {image_filename} as {image_path} "
+                  f"(encode queue: {image_store.image_encoder.queue_depth})")
+            encodes.append((image_path, encode))
+        image_sources.append(image_path)
+        kept.append(index)
+        sources["images"][image_path] = {key: image.get(key) for key in ("url", "etag", "last_modified")}
+
+    return (topic.level, section_title, text, image_sources, keep_images(blocks, kept)), encodes, sources
+
+def limit_manifest(manifest):
+    if DEBUG:
+        topic_indexes = [i for i, topic in enumerate(manifest) if topic.url]
+        if len(topic_indexes) > DEBUG_SECTION_LIMIT:
+            print(f"Debug mode: Limiting crawl to {DEBUG_SECTION_LIMIT} sections")
+            return manifest[:topic_indexes[DEBUG_SECTION_LIMIT]]
+    return manifest
+
+def find_cached_topics(url, manifest, refresh=False, stale=()):
+    # Chapters and sections have no document of their own, they only
+    # contribute a heading, so they never need crawling. Stale topics are
+    # cached but out of date
+    image_dir = os.path.join(IMAGE_DIR, IMAGE_PROFILE)
+    return [not topic.url or (not refresh and topic.url not in stale
+                              and crawl_cache.has_topic(CACHE_DIR, url, topic, image_dir))
+            for topic in manifest]
+
+def iter_topic_sections(url, manifest):
+    # Sections are read back from the cache one at a time, so neither the
+    # crawler nor the renderer has to hold the whole manual in memory
+    for topic in manifest:
+        if not topic.url:
+            yield topic, (topic.level, topic.title, "", [], [])
+            continue
+
+        section = crawl_cache.load_topic(CACHE_DIR, url, topic)
+        if section is None:
+            print(f"Missing section, not in {CACHE_DIR}: {topic.title} ({topic.url})")
+            continue
+        yield topic, section
+
+def iter_sections(url, manifest):
+    for _, section in iter_topic_sections(url, manifest):
+        yield section
+
+def export_bundle(url, manifest, bundle_dir=BUNDLE_DIR, title=None):
+    # The renderer only ever reads the bundle, so it can run on its own
+    # (render_manual.py) and on a machine that never crawled
+    with span("write_bundle"):
+        section_count = write_bundle(bundle_dir, url, iter_topic_sections(url, manifest), title)
+    print(f"Wrote {section_count} sections to {bundle_dir}/")
+
+def index_cached_topics(search_index, url, manifest, cached):
+    # Topics fetched by an earlier run are indexed from the cache, everything
+    # fetched now is indexed as it is saved
+    for topic, is_cached in zip(manifest, cached):
+        if is_cached and topic.url:
+            section = crawl_cache.load_topic(CACHE_DIR, url, topic)
+            if section is not None:
+                search_index.add(topic.url, topic.title, section[2])
+
+def write_search_index(search_index, index_path=SEARCH_INDEX):
+    with span("search_index"):
+        search_index.write(index_path)
+    print(f"Search index of {len(search_index.docs)} topics written to {index_path}")
+
+class CrawlSession:
+    # What every manual crawled in one run shares: one limiter per backend, so
+    # the server sees a single crawler however many manuals there are; one
+    # image store, so a diagram used by several manuals is encoded and stored
+    # once; one HTTP connection pool and one browser
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY):
+        self.concurrency = concurrency
+        self.limiters = {}
+        self.resources = AsyncExitStack()
+        self.http_session = None
+        self.browser = None
+
+    async def __aenter__(self):
+        image_encoder = self.resources.enter_context(ImageEncoder())
+        self.image_store = ImageStore(IMAGE_DIR, image_encoder, IMAGE_PROFILE)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.image_store.save_dimensions()
+        print(f"Reused {self.image_store.duplicates} duplicate image(s) from {self.image_store.image_dir}/")
+        await self.resources.aclose()
+
+    def limiter(self, name):
+        # The limiter starts at the requested concurrency and never goes
+        # above it; it only backs off while the server struggles
+        if name not in self.limiters:
+            self.limiters[name] = AdaptiveLimiter(self.concurrency, self.concurrency)
+        return self.limiters[name]
+
+    async def open_backend(self, name, url):
+        # Backends are imported on demand so a missing optional dependency
+        # only matters when that backend is actually used
+        if name == "http":
+            from http_backend import HttpBackend, open_session
+            if self.http_session is None:
+                self.http_session = await self.resources.enter_async_context(open_session(self.concurrency))
+            return HttpBackend(url, self.concurrency, self.http_session, self.limiter(name))
+        from playwright_backend import PlaywrightBackend, PlaywrightBrowser
+        if self.browser is None:
+            self.browser = await self.resources.enter_async_context(PlaywrightBrowser())
+        return PlaywrightBackend(url, self.browser, self.limiter(name))
+
+async def crawl(session, backend, url, refresh, stale=(), index_path=SEARCH_INDEX):
+    # The page embeds the whole nav tree, so build the topic list from it
+    # once instead of clicking every <li> (chapter headers included)
+    with span("manifest"):
+        manifest = load_manifest(await backend.fetch_manifest_html())
+    crawl_cache.save_manifest(CACHE_DIR, url, manifest)
+    manifest = limit_manifest(manifest)
+
+    topic_count = sum(1 for topic in manifest if topic.url)
+    print(f"Found {topic_count} topics in {len(manifest)} navigation entries")
+
+    done = find_cached_topics(url, manifest, refresh, stale)
+    search_index = SearchIndexBuilder()
+    index_cached_topics(search_index, url, manifest, done)
+
+    queue = asyncio.Queue()
+    for index, topic in enumerate(manifest):
+        if not done[index]:
+            queue.put_nowait((index, topic))
+
+    processed_count = topic_count - queue.qsize()
+    if processed_count:
+        print(f"Resuming: {processed_count} topics loaded from {CACHE_DIR}")
+    if queue.empty():
+        write_search_index(search_index, index_path)
+        return manifest
+
+    async def finish_topic(index, topic, section, encodes, sources):
+        nonlocal processed_count
+        try:
+            level, title, text, image_sources, blocks = section
+            encoded = await asyncio.gather(*(future for _, future in encodes), return_exceptions=True)
+            failed_paths = set()
+            for (image_path, _), result in zip(encodes, encoded):
+                if isinstance(result, Exception):
+                    print(f"Error encoding image {image_path}: {str(result)}")
+                    count("image_errors")
+                    failed_paths.add(image_path)
+                else:
+                    print(f"Saved image: {image_path}")
+            if failed_paths:
+                kept = [i for i, image_path in enumerate(image_sources) if image_path not in failed_paths]
+                section = (level, title, text, [image_sources[i] for i in kept], keep_images(blocks, kept))
+
+            # Save each topic as soon as it is done so a crash only costs the
+            # topics still in flight. The section itself is not kept
+            with span("save_topic"):
+                crawl_cache.save_topic(CACHE_DIR, url, topic, section, sources)
+            search_index.add(topic.url, topic.title, section[2])
+            done[index] = True
+            processed_count += 1
+            print(f"Processed [{processed_count}/{topic_count}]: {topic.title} (Level {topic.level})")
+        except Exception as e:
+            print(f"Error processing item {index+1}: {str(e)}")
+            count("topic_errors")
+
+    pending_topics = []
+    # Topics that still failed after their retries, tried again at the end
+    failed = []
+
+    async def worker(backend_worker):
+        while not queue.empty():
+            index, topic = queue.get_nowait()
+            try:
+                section, encodes, sources = await retrieve_topic(backend_worker, topic, session.image_store)
+                # Images finish encoding in the background while this worker
+                # moves on to the next topic
+                pending_topics.append(asyncio.create_task(finish_topic(index, topic, section, encodes, sources)))
+            except Exception as e:
+                print(f"Error processing item {index+1}: {str(e)}")
+                count("topic_errors")
+                failed.append((index, topic, str(e)))
+
+    # Manuals crawled together share the backend's limiter, so between them
+    # they never have more requests in flight than it allows
+    limiter = backend.limiter
+    workers = await backend.open_workers(max(1, min(limiter.maximum, queue.qsize())))
+    print(f"Crawling with {len(workers)} {backend.name} worker(s), {int(limiter.limit)} at a time to start with")
+    with span("crawl_topics", backend=backend.name):
+        await asyncio.gather(*(worker(backend_worker) for backend_worker in workers))
+
+        # One more round for the failures, one at a time. A single worker
+        # keeps it serial, and the shared limiter keeps it within the budget
+        # of the other manuals still crawling
+        if failed:
+            print(f"Retrying {len(failed)} failed topic(s) one at a time")
+            for index, topic, _ in failed:
+                queue.put_nowait((index, topic))
+            failed.clear()
+            await worker(workers[0])
+
+        await asyncio.gather(*pending_topics)
+    session.image_store.save_dimensions()
+
+    for index, topic, error in failed:
+        print(f"Failed: {topic.title} ({topic.url}): {error}")
+    count("topics_failed", len(failed))
+    write_search_index(search_index, index_path)
+
+    return manifest
+
+async def retrieve_website_content(url, concurrency=DEFAULT_CONCURRENCY, refresh=False, backend=DEFAULT_BACKEND,
+                                   stale=(), session=None, index_path=SEARCH_INDEX, reindex=False):
+    # reindex rebuilds the search index even when every topic is cached, for
+    # an update that only removed topics
+    if session is None:
+        async with CrawlSession(concurrency) as session:
+            return await retrieve_website_content(url, concurrency, refresh, backend, stale, session, index_path,
+                                                  reindex)
+
+    # A previous (possibly crashed) run may already have fetched every topic,
+    # in which case there is no need to fetch anything at all
+    manifest = None if refresh else crawl_cache.load_manifest(CACHE_DIR, url)
+    if manifest is not None:
+        manifest = limit_manifest(manifest)
+        cached = find_cached_topics(url, manifest, stale=stale)
+        if all(cached):
+            print(f"All {len(manifest)} sections found in {CACHE_DIR}, skipping crawl")
+            if reindex or not os.path.exists(index_path):
+                search_index = SearchIndexBuilder()
+                index_cached_topics(search_index, url, manifest, cached)
+                write_search_index(search_index, index_path)
+            return manifest
+
+    # The HTTP backend handles the common case without a browser. Anything it
+    # could not fetch is picked up by Playwright, which only crawls the
+    # topics still missing from the cache
+    backends = ["http", "playwright"] if backend == "http" else [backend]
+    for name in backends:
+        try:
+            async with await session.open_backend(name, url) as fetch_backend:
+                manifest = await crawl(session, fetch_backend, url, refresh, stale, index_path)
+        except Exception as e:
+            print(f"Error crawling with the {name} backend: {str(e)}")
+            continue
+
+        missing = find_cached_topics(url, manifest).count(False)
+        if not missing:
+            break
+        print(f"{missing} topic(s) could not be fetched with the {name} backend")
+        count("topics_retried", missing)
+        refresh = False
+        stale = ()
+
+    if manifest is None:
+        raise RuntimeError(f"Could not load the manual navigation from {url}")
+
+    # Never drop a topic without saying so
+    for topic, cached in zip(manifest, find_cached_topics(url, manifest)):
+        if not cached:
+            print(f"Missing from the manual, could not be fetched: {topic.title} ({topic.url})")
+    return manifest
+
+async def update_website_content(url, concurrency=DEFAULT_CONCURRENCY, backend=DEFAULT_BACKEND, session=None,
+                                 index_path=SEARCH_INDEX):
+    # Checks every cached topic and image with a conditional request and only
+    # crawls what changed. Returns the manifest and whether anything changed
+    if session is None:
+        async with CrawlSession(concurrency) as session:
+            return await update_website_content(url, concurrency, backend, session, index_path)
+
+    previous_manifest = crawl_cache.load_manifest(CACHE_DIR, url)
+    if previous_manifest is None:
+        print(f"Nothing cached in {CACHE_DIR} yet, downloading everything")
+        return await retrieve_website_content(url, concurrency, backend=backend, session=session,
+                                              index_path=index_path), True
+
+    # Conditional requests need response headers, which only the HTTP
+    # backend has, so it does the checking whatever backend crawls
+    with span("check_updates"):
+        async with await session.open_backend("http", url) as http_backend:
+            update_check = await check_for_updates(http_backend, url, previous_manifest, limit_manifest)
+    print(f"{len(update_check.stale)} cached topic(s) out of date")
+
+    # Removed topics must leave the search index too
+    manifest = await retrieve_website_content(url, concurrency, backend=backend, stale=update_check.stale,
+                                              session=session, index_path=index_path,
+                                              reindex=bool(update_check.removed or update_check.added))
+    return manifest, print_change_report(url, update_check)
+
+async def crawl_manual(session, manual, refresh=False, backend=DEFAULT_BACKEND, update=False):
+    # Returns the manifest and whether anything changed, or no manifest if
+    # the manual could not be crawled; one failed manual does not stop a batch
+    print(f"Crawling {manual.title} ({manual.url})")
+    try:
+        if update and not refresh:
+            return await update_website_content(manual.url, session.concurrency, backend, session,
+                                                manual.search_index)
+        return await retrieve_website_content(manual.url, session.concurrency, refresh, backend, session=session,
+                                              index_path=manual.search_index), True
+    except Exception as e:
+        print(f"Error crawling {manual.title}: {str(e)}")
+        count("manuals_failed")
+        return None, False
+
+async def main(concurrency=DEFAULT_CONCURRENCY, refresh=False, render_jobs=1, backend=DEFAULT_BACKEND, update=False,
+               dedupe_threshold=DEDUPE_THRESHOLD, render=True, manuals=None, formats=DEFAULT_FORMATS):
+    # Several manuals (models and locales) are crawled side by side in one
+    # session, then each gets its own bundle and outputs
+    manuals = manuals or [manual_for()]
+    with profile("crawl"), span("crawl"):
+        async with CrawlSession(concurrency) as session:
+            results = await asyncio.gather(*(crawl_manual(session, manual, refresh, backend, update)
+                                             for manual in manuals))
+    if all(manifest is None for manifest, _ in results):
+        raise RuntimeError("None of the manuals could be crawled")
+
+    for manual, (manifest, changed) in zip(manuals, results):
+        if manifest is not None and (changed or not os.path.exists(manual.bundle_dir)):
+            export_bundle(manual.url, manifest, manual.bundle_dir, manual.title)
+
+    if render:
+        # reportlab is only needed from here on, a crawl-only run never loads it
+        from render_manual import render_bundle
+
+        for manual, (manifest, changed) in zip(manuals, results):
+            outputs = manual_outputs(manual, formats)
+            if manifest is None:
+                print(f"Not rendering {manual.title}, it could not be crawled")
+            elif not changed and all(os.path.exists(path) for path in outputs.values()):
+                print(f"No changes, {', '.join(outputs.values())} up to date")
+            else:
+                render_bundle(manual.bundle_dir, render_jobs, dedupe_threshold, outputs, manual.locale,
+                              manual.dedupe_log)
+
+    metrics.report()
+    print(f"Metrics written to {metrics.write()}")
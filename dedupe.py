@@ -0,0 +1,126 @@
+import heapq
+import json
+import os
+import re
+import zlib
+from collections import defaultdict
+
+from metrics import count
+from settings import DEDUPE_LOG, DEDUPE_THRESHOLD
+
+# Kept sections this close below the threshold are logged too, to help tune it
+REVIEW_MARGIN = 0.1
+
+SHINGLE_WORDS = 5
+SKETCH_SIZE = 128
+
+# Short texts ("See the next section.") are alike by nature, leave them alone
+MIN_WORDS = 20
+
+
+def normalize(text):
+    # Case, punctuation and whitespace differences do not make a section new
+    return re.findall(r"\w+", text.lower())
+
+
+def exact_key(words):
+    # Two cheap non-cryptographic checksums plus the length; a collision on
+    # all three between different sections is not a practical concern
+    data = " ".join(words).encode()
+    return zlib.crc32(data), zlib.adler32(data), len(data)
+
+
+def sketch(words, size=SKETCH_SIZE):
+    # Bottom-k MinHash: the smallest hashes of the word shingles stand in for
+    # the whole set when estimating similarity
+    shingles = {zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode())
+                for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    return frozenset(heapq.nsmallest(size, shingles))
+
+
+def similarity(sketch_a, sketch_b, size=SKETCH_SIZE):
+    smallest = heapq.nsmallest(size, sketch_a | sketch_b)
+    both = sketch_a & sketch_b
+    return sum(1 for value in smallest if value in both) / len(smallest)
+
+
+class Deduplicator:
+    def __init__(self, threshold=DEDUPE_THRESHOLD):
+        self.threshold = threshold
+        self.exact = {}
+        self.sketches = []
+        # Hash value -> sketches that contain it, so only sections sharing
+        # shingles are ever compared
+        self.sketch_index = defaultdict(list)
+        self.decisions = []
+
+    def check(self, title, text, images=frozenset()):
+        # Returns the title of the earlier section this one duplicates, or None.
+        # images are the section's image names, which name the content: the
+        # same text with a different diagram is not a duplicate, since the
+        # diagram would be lost with it
+        words = normalize(text)
+        if len(words) < MIN_WORDS:
+            return None
+
+        key = exact_key(words) + (images,)
+        if key in self.exact:
+            self.log(title, "exact", self.exact[key], 1.0)
+            return self.exact[key]
+
+        original, best = None, 0.0
+        if self.threshold < 1:
+            section_sketch = sketch(words)
+            candidates = {index for value in section_sketch for index in self.sketch_index[value]}
+            for index in sorted(candidates):
+                candidate_title, candidate_sketch, candidate_images = self.sketches[index]
+                if candidate_images != images:
+                    continue
+                score = similarity(section_sketch, candidate_sketch)
+                if score > best:
+                    original, best = candidate_title, score
+
+        if original is not None and best >= self.threshold:
+            self.log(title, "near", original, best)
+            return original
+        if original is not None and best >= self.threshold - REVIEW_MARGIN:
+            self.log(title, "kept", original, best)
+
+        self.exact[key] = title
+        if self.threshold < 1:
+            for value in section_sketch:
+                self.sketch_index[value].append(len(self.sketches))
+            self.sketches.append((title, section_sketch, images))
+        return None
+
+    def log(self, title, decision, original, score):
+        self.decisions.append({"title": title, "decision": decision, "similar_to": original,
+                               "similarity": round(score, 3)})
+
+    def write_log(self, path=DEDUPE_LOG):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding="utf-8") as f:
+            for decision in self.decisions:
+                f.write(json.dumps(decision, ensure_ascii=False) + "\n")
+
+
+def dedupe_sections(sections, threshold=DEDUPE_THRESHOLD, log_path=DEDUPE_LOG):
+    # Passes sections through, replacing the body of a duplicate with a
+    # reference to the first copy. The heading stays, so the outline and
+    # the table of contents are unchanged
+    deduplicator = Deduplicator(threshold)
+    for section in sections:
+        level, title, text, image_sources, blocks = section
+        original = deduplicator.check(title, text, frozenset(os.path.basename(path) for path in image_sources))
+        if original is None:
+            yield section
+            continue
+
+        print(f"Skipping duplicate content: {title} (same as {original})")
+        count("sections_deduplicated")
+        reference = f"See {original}."
+        yield (level, title, reference, [], [["paragraph", reference]])
+
+    deduplicator.write_log(log_path)
+    dropped = sum(1 for decision in deduplicator.decisions if decision["decision"] != "kept")
+    print(f"Deduplicated {dropped} section(s), decisions logged to {log_path}")
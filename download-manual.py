@@ -1,265 +1,154 @@
-import asyncio
-import os
-import re
-from playwright.async_api import async_playwright
-import hashlib
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-import base64
-from io import BytesIO
-from PIL import Image as PILImage
-
-WAIT_SECONDS_BETWEEN_CLICKS = 1
-WAIT_SECONDS_BETWEEN_IMAGES = 2
-
-# Debug flag and section limit
-DEBUG = False
-DEBUG_SECTION_LIMIT = 100
-
-def get_content_hash(content):
-    return hashlib.md5(content.encode()).hexdigest()
-
-async def get_page_content(page):
-    await page.wait_for_selector("#ohb_topic")
-
-    content = await page.evaluate("""
-        async () => {
-            const obj = document.querySelector('#ohb_topic');
-            if (obj && obj.contentDocument) {
-                const body = obj.contentDocument.body;
-
-                // Ensure images are fully loaded
-                const imgElements = body.querySelectorAll('img');
-                for (const img of imgElements) {
-                    if (!img.complete) {
-                        const promise = new Promise((resolve) => {
-                            img.onload = resolve;
-                            img.onerror = resolve;
-                        });
-                        await promise;
-                    }
-                }
-
-                // Exclude the header elements
-                const headerElements = body.querySelectorAll('h1, h2, h3, h4, h5, h6');
-                headerElements.forEach(el => el.remove());
-
-                // Get the remaining text content
-                const textContent = body.innerText;
-
-                // Get the images
-                const objectImages = body.querySelectorAll('object[type="image/png"]');
-                const imageSources = Array.from(objectImages).map((img, idx) => {
-                    const data = img.getAttribute('data');
-                    const canvas = document.createElement('canvas');
-                    const ctx = canvas.getContext('2d');
-                    const image = new Image();
-                    image.src = data;
-                    canvas.width = image.width;
-                    canvas.height = image.height;
-                    ctx.drawImage(image, 0, 0);
-                    const dataUrl = canvas.toDataURL('image/png');
-                    return {data: dataUrl, filename: `image_${idx}.png`};
-                });
-
-                return { textContent, imageSources };
-            }
-            return { textContent: '', imageSources: [] };
-        }
-    """)
-
-    return content
-
-async def retrieve_website_content(url):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
-
-        await page.goto(url)
-        await page.wait_for_selector("#navigation_bar")
-
-        nav_items = await page.query_selector_all("#navigation_bar li")
-
-        contents = []
-        processed_content_hashes = set()
-        processed_count = 0
-
-        image_dir = "images"
-        os.makedirs(image_dir, exist_ok=True)
-
-        for index, item in enumerate(nav_items):
-            try:
-                section_title = await item.inner_text()
-
-                # Sanitize the section title to create a valid filename
-                section_title = re.sub(r'[\\/*?:"<>|]', "_", section_title)
-                level = len(await item.query_selector_all("xpath=ancestor::ul"))
-
-                await item.click()
-                await asyncio.sleep(WAIT_SECONDS_BETWEEN_CLICKS)  # Wait for content to load
-
-                content = await get_page_content(page)
-                content_hash = get_content_hash(content['textContent'])
-
-                print(f"Processing: {section_title}")
-                print(f"Content hash: {content_hash}")
-                print("Content preview: {}...".format(content['textContent'][:100].replace('\n', ' ')))
-
-                if content_hash in processed_content_hashes:
-                    print(f"Skipping duplicate content: {section_title}")
-                    continue
-
-                # Save the images
-                image_sources = []
-                for i, image_source in enumerate(content['imageSources']):
-                    image_filename = f"{section_title}_{image_source['filename']}"
-                    image_path = os.path.join(image_dir, image_filename)
-
-                    # if the file already exists, check if the size of the file
-                    # is non-zero and if so skip it. otherwise continue and
-                    # try to save the image again
-                    if os.path.exists(image_path):
-                        if os.path.getsize(image_path) > 0:
-                            print(f"Skipping existing image: {image_path}")
-                            image_sources.append(image_path)
-                            continue
-
-                    print(f"Saving embedded image: {image_filename}")
-
-                    # Retry logic for 0-byte images
-                    retry_count = 3
-                    for attempt in range(retry_count):
-                        # wait for image to be done downloading locally
-                        await asyncio.sleep(WAIT_SECONDS_BETWEEN_IMAGES)
-
-                        # Decode base64 image data
-                        image_data = base64.b64decode(image_source['data'].split(',')[1])
-                        print(f"Image data length for {image_filename}: {len(image_data)}")
-
-                        # Convert PNG to JPEG and reduce quality
-                        image = PILImage.open(BytesIO(image_data))
-                        jpeg_image = BytesIO()
-                        image.convert("RGB").save(jpeg_image, format="JPEG", quality=75)
-                        jpeg_image_data = jpeg_image.getvalue()
-
-                        with open(image_path.replace(".png", ".jpeg"), 'wb') as handler:
-                            handler.write(jpeg_image_data)
-                        print(f"Saved image: {image_path.replace('.png', '.jpeg')}")
-
-                        if os.path.getsize(image_path.replace(".png", ".jpeg")) > 0:
-                            image_sources.append(image_path.replace(".png", ".jpeg"))
-                            break
-                        else:
-                            print(f"Retrying download for image: {image_filename} (Attempt {attempt + 1})")
-
-                contents.append((level, section_title, content['textContent'], image_sources))
-                processed_content_hashes.add(content_hash)
-                processed_count += 1
-                print(f"Processed [{processed_count}/{len(nav_items)}]: {section_title} (Level {level})")
-
-                if DEBUG and processed_count >= DEBUG_SECTION_LIMIT:
-                    print(f"Debug mode: Stopped after processing {processed_count} sections")
-                    break
-
-            except Exception as e:
-                print(f"Error processing item {index+1}: {str(e)}")
-
-        await browser.close()
-        return contents
-
-def create_pdf(contents):
-    doc = SimpleDocTemplate("fisker_ocean_manual_debug.pdf", pagesize=letter)
-    styles = getSampleStyleSheet()
-
-    # Create custom styles only if they don't exist
-    custom_styles = [
-        ('Heading1', 18, 12),
-        ('Heading2', 16, 10),
-        ('Heading3', 14, 8),
-        ('Heading4', 12, 6)
-    ]
-
-    for name, font_size, space_after in custom_styles:
-        if name not in styles:
-            styles.add(ParagraphStyle(name=name, fontSize=font_size, spaceAfter=space_after, keepWithNext=True))
-
-    flowables = []
-
-    title_style = ParagraphStyle(name='Title', parent=styles['Heading1'], alignment=TA_CENTER)
-    flowables.append(Paragraph("Fisker Ocean Manual", title_style))
-    flowables.append(Spacer(1, 36))
-
-    for level, title, content, image_sources in contents:
-        heading_style = f'Heading{min(level + 1, 4)}'
-        flowables.append(Paragraph(title, styles[heading_style]))
-        flowables.append(Spacer(1, 12))
-
-        # Split content around images
-        content_parts = re.split(r'\[IMAGE\]', content)
-        content_index = 0
-
-        for image_path in image_sources:
-            if os.path.exists(image_path):
-                try:
-                    img = PILImage.open(image_path)
-
-                    # Calculate the maximum width and height
-                    max_width = 400
-                    max_height = 500  # Adjust this value as needed
-
-                    # Calculate the scaling factor
-                    width_ratio = max_width / img.width
-                    height_ratio = max_height / img.height
-                    scale_factor = min(width_ratio, height_ratio)
-
-                    # Calculate new dimensions
-                    new_width = int(img.width * scale_factor)
-                    new_height = int(img.height * scale_factor)
-
-                    # Add text before the image if any
-                    if content_index < len(content_parts):
-                        part = content_parts[content_index].strip()
-                        if part:
-                            flowables.append(Paragraph(part, styles['BodyText']))
-                            flowables.append(Spacer(1, 12))
-                        content_index += 1
-
-                    # Add image
-                    img_flowable = Image(image_path, width=new_width, height=new_height)
-                    flowables.append(img_flowable)
-                    flowables.append(Spacer(1, 12))
-                except Exception as e:
-                    print(f"Error adding image {image_path}: {str(e)}")
-                    # If there's an error, add a placeholder text
-                    flowables.append(Paragraph(f"[Image: {os.path.basename(image_path)}]", styles['BodyText']))
-                    flowables.append(Spacer(1, 12))
-            else:
-                print(f"Image file not found: {image_path}")
-                flowables.append(Paragraph(f"[Missing Image: {os.path.basename(image_path)}]", styles['BodyText']))
-                flowables.append(Spacer(1, 12))
-
-        # Add remaining text after images
-        while content_index < len(content_parts):
-            part = content_parts[content_index].strip()
-            if part:
-                flowables.append(Paragraph(part, styles['BodyText']))
-                flowables.append(Spacer(1, 12))
-            content_index += 1
-
-    try:
-        doc.build(flowables)
-        print(f"PDF created: fisker_ocean_manual_debug.pdf with {len(contents)} unique sections")
-    except Exception as e:
-        print(f"Error building PDF: {str(e)}")
-
-async def main():
-    url = "https://www.fiskerinc.com/owners_manual/Ocean/content/en-us/owner_guide.html"
-    contents = await retrieve_website_content(url)
-    create_pdf(contents)
-    print(f"PDF created: fisker_ocean_manual_debug.pdf with {len(contents)} unique sections")
+import argparse
+import sys
+
+from manuals import PATH_OPTIONS, add_manual_argument, parse_manual, selected_manuals
+from render_manual import add_render_arguments, render_main
+from search_index import add_search_arguments, search_main
+from settings import (BROWSER_SERVICE_PORT, BUNDLE_DIR, CACHE_DIR, DEFAULT_BACKEND, DEFAULT_CONCURRENCY,
+                      DEFAULT_FORMATS, DEFAULT_IMAGE_PROFILE, IMAGE_PROFILES, PROFILE_PHASES)
+from stats import add_stats_arguments, stats_main
+
+# Without a command this crawls the manual and renders the PDF, as it always
+# has. The commands run one step each:
+#   crawl   fetch the manual into the cache and write the bundle
+#   render  build the PDF from the bundle (reportlab, no browser)
+#   search  query the offline search index
+#   stats   show what earlier runs left on disk
+#   browser start, stop or check the warm browser the Playwright backend
+#           attaches to instead of launching its own
+# Only the modules a command needs are imported, so everything but crawling
+# starts without loading asyncio, aiohttp or Playwright
+
+
+def add_crawl_arguments(parser):
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"most topic and image requests in flight at the same time (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--refresh", action="store_true",
+                        help=f"ignore topics cached in {CACHE_DIR}/ and fetch everything again")
+    parser.add_argument("--backend", choices=["http", "playwright"], default=DEFAULT_BACKEND,
+                        help="fetch topics over plain HTTP (falling back to the browser) or always with the browser")
+    parser.add_argument("--update", action="store_true",
+                        help="only re-download topics and images that changed since the last run, and report the changes")
+    parser.add_argument("--image-profile", choices=sorted(IMAGE_PROFILES), default=DEFAULT_IMAGE_PROFILE,
+                        help="resolution and quality of stored images: " + ", ".join(
+                            f"{name} {profile['dpi']} dpi" for name, profile in IMAGE_PROFILES.items())
+                        + f" (default: {DEFAULT_IMAGE_PROFILE})")
+
+
+def add_profile_argument(parser, phases):
+    parser.add_argument("--profile", action="append", choices=phases, default=[],
+                        help="run a phase under cProfile and save the stats next to the metrics (repeatable)")
+
+
+def crawl_main(args, render=False):
+    # asyncio, aiohttp, the image pipeline and the backends load from here on
+    import asyncio
+
+    import crawler
+    from metrics import profiled_phases
+
+    profiled_phases.update(args.profile)
+    crawler.IMAGE_PROFILE = args.image_profile
+    dedupe_threshold = None if args.no_dedupe else args.dedupe_threshold
+    asyncio.run(crawler.main(args.concurrency, args.refresh, args.render_jobs, args.backend, args.update,
+                             dedupe_threshold, render, selected_manuals(args),
+                             getattr(args, "format", None) or DEFAULT_FORMATS))
+    return 0
+
+
+def search_command(args):
+    if args.manual:
+        if len(args.manual) > 1:
+            raise SystemExit("search works on one --manual at a time")
+        args.index = args.manual[0].search_index
+    return search_main(args)
+
+
+def browser_main(args):
+    # subprocess and http.client, only needed to manage the service
+    from browser_service import service_main
+
+    return service_main(args)
+
+
+# Repeatable options given after the command are collected under this
+# suffix, then added to those given before it
+AFTER_COMMAND = "_after_command"
+
+
+def keep_earlier_values(parser, command_parser):
+    # Options that can come before the command as well as after it are
+    # registered on both parsers. The command's parse copies every value it
+    # has over the top-level ones, so its defaults are suppressed and a value
+    # given before the command is not silently replaced
+    shared = {action.dest for action in parser._actions}
+    for action in command_parser._actions:
+        if action.dest in shared:
+            action.default = argparse.SUPPRESS
+            if isinstance(action, argparse._AppendAction):
+                action.dest += AFTER_COMMAND
+
+
+def parse_arguments(parser, argv=None):
+    args = parser.parse_args(argv)
+    for dest, values in list(vars(args).items()):
+        if dest.endswith(AFTER_COMMAND):
+            delattr(args, dest)
+            dest = dest[:-len(AFTER_COMMAND)]
+            setattr(args, dest, (getattr(args, dest) or []) + values)
+    return args
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Download the Fisker Ocean manual as a PDF")
+    add_crawl_arguments(parser)
+    add_render_arguments(parser)
+    parser.add_argument("--no-render", action="store_true",
+                        help=f"only crawl and write {BUNDLE_DIR}/, the same as the crawl command")
+    add_profile_argument(parser, PROFILE_PHASES)
+    parser.set_defaults(run=lambda args: crawl_main(args, render=not args.no_render))
+
+    commands = parser.add_subparsers(title="commands", dest="command",
+                                     description="run a single step instead of crawling and rendering")
+
+    crawl_parser = commands.add_parser("crawl", help="fetch the manual and write the bundle, without rendering")
+    add_manual_argument(crawl_parser)
+    add_crawl_arguments(crawl_parser)
+    crawl_parser.add_argument("--bundle", help=f"bundle directory (default: {BUNDLE_DIR}, or one per manual)")
+    add_profile_argument(crawl_parser, ["crawl"])
+    crawl_parser.set_defaults(run=crawl_main)
+
+    render_parser = commands.add_parser("render", help="build the PDF from the bundle without crawling")
+    add_render_arguments(render_parser)
+    add_profile_argument(render_parser, ["render"])
+    render_parser.set_defaults(run=render_main)
+
+    search_parser = commands.add_parser("search", help="search the downloaded manual offline")
+    add_search_arguments(search_parser)
+    search_parser.add_argument("--manual", type=parse_manual, action="append", metavar="MODEL/LOCALE",
+                               help="search this manual's index instead of the default manual's")
+    search_parser.set_defaults(run=search_command)
+
+    stats_parser = commands.add_parser("stats", help="show the cache, bundle, search index and last run")
+    add_stats_arguments(stats_parser)
+    stats_parser.set_defaults(run=stats_main)
+
+    browser_parser = commands.add_parser("browser", help="manage the warm browser kept for the Playwright backend")
+    browser_parser.add_argument("action", choices=["start", "stop", "status", "run"],
+                                help="start or stop the background service, show its status, or run it in the foreground")
+    browser_parser.add_argument("--port", type=int, default=BROWSER_SERVICE_PORT,
+                                help=f"DevTools port the browser listens on (default: {BROWSER_SERVICE_PORT})")
+    browser_parser.set_defaults(run=browser_main)
+
+    for command_parser in commands.choices.values():
+        keep_earlier_values(parser, command_parser)
+    return parser
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = build_parser()
+    args = parse_arguments(parser)
+    paths = [getattr(args, option, None) for option in PATH_OPTIONS.values()]
+    if isinstance(args.manual, list) and len(args.manual) > 1 and any(paths):
+        parser.error("--bundle, --output, --epub and --site can only be used with a single --manual")
+    sys.exit(args.run(args))
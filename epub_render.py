@@ -0,0 +1,120 @@
+import os
+import time
+import uuid
+import zipfile
+from html import escape
+
+from html_site import STYLE, section_html
+from manuals import MANUAL_TITLE
+from settings import DEFAULT_LOCALE, OUTPUT_EPUB
+
+# The manual as an EPUB 3 book for phones and e-readers: one XHTML document
+# per top-level chapter, written into the archive as soon as the chapter is
+# complete, and the images stored as they are (JPEG gains nothing from
+# deflate). The markup is the HTML site's, without lazy loading
+CONTAINER_XML = """<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>
+"""
+MEDIA_TYPES = {".jpeg": "image/jpeg", ".jpg": "image/jpeg", ".png": "image/png"}
+
+
+def xhtml_page(title, body, language):
+    return (f'<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+            f'<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" '
+            f'lang="{language}" xml:lang="{language}"><head><meta charset="utf-8"/><title>{escape(title)}</title>'
+            f'<link rel="stylesheet" type="text/css" href="style.css"/></head><body>\n{body}</body></html>\n')
+
+
+def chapter_document(number):
+    return f"chapter-{number:03d}.xhtml"
+
+
+class EpubSink:
+    name = "epub"
+
+    def __init__(self, output_epub=OUTPUT_EPUB, title=MANUAL_TITLE, image_dimensions=None, language=DEFAULT_LOCALE):
+        self.output_epub = output_epub
+        self.title = title
+        self.image_dimensions = image_dimensions or {}
+        # BCP 47 casing, as in en-US
+        language, _, region = language.partition("-")
+        self.language = f"{language}-{region.upper()}" if region else language
+
+    def nav_document(self, contents):
+        # contents holds (chapter document, [(anchor, title), ...]) per chapter
+        items = []
+        for document, sections in contents:
+            (anchor, title), subsections = sections[0], sections[1:]
+            item = f'<li><a href="{document}#{anchor}">{escape(title)}</a>'
+            if subsections:
+                item += "<ol>" + "".join(f'<li><a href="{document}#{anchor}">{escape(title)}</a></li>'
+                                         for anchor, title in subsections) + "</ol>"
+            items.append(item + "</li>")
+        body = f'<nav epub:type="toc" id="toc"><h1>{escape(self.title)}</h1><ol>{"".join(items)}</ol></nav>\n'
+        return xhtml_page(self.title, body, self.language)
+
+    def package_document(self, contents, images):
+        identifier = uuid.uuid5(uuid.NAMESPACE_URL, self.title)
+        modified = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        manifest = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>',
+                    '<item id="style" href="style.css" media-type="text/css"/>']
+        manifest += [f'<item id="c{number}" href="{document}" media-type="application/xhtml+xml"/>'
+                     for number, (document, _) in enumerate(contents, 1)]
+        manifest += [f'<item id="i{number}" href="images/{name}" '
+                     f'media-type="{MEDIA_TYPES.get(os.path.splitext(name)[1], "image/jpeg")}"/>'
+                     for number, name in enumerate(images, 1)]
+        spine = "".join(f'<itemref idref="c{number}"/>' for number in range(1, len(contents) + 1))
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n'
+                f'<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id" '
+                f'xml:lang="{self.language}">\n'
+                f'<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                f'<dc:identifier id="id">urn:uuid:{identifier}</dc:identifier>'
+                f'<dc:title>{escape(self.title)}</dc:title><dc:language>{self.language}</dc:language>'
+                f'<meta property="dcterms:modified">{modified}</meta></metadata>\n'
+                f'<manifest>{"".join(manifest)}</manifest>\n<spine>{spine}</spine>\n</package>\n')
+
+    def render(self, sections):
+        contents = []
+        images = []
+        stored = set()
+        chapter = None
+        section_count = 0
+        tmp_path = f"{self.output_epub}.tmp"
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as epub:
+            # The mimetype must come first and uncompressed
+            epub.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", zipfile.ZIP_STORED)
+            epub.writestr("META-INF/container.xml", CONTAINER_XML)
+            epub.writestr("OEBPS/style.css", STYLE)
+
+            def write_chapter():
+                document = chapter_document(len(contents) + 1)
+                epub.writestr(f"OEBPS/{document}", xhtml_page(chapter[0][0][1], "".join(chapter[1]), self.language))
+                contents.append((document, chapter[0]))
+
+            for section in sections:
+                level, title, _, image_paths, _ = section
+                if chapter is None or level == 1:
+                    if chapter is not None:
+                        write_chapter()
+                    chapter = ([], [])
+
+                section_count += 1
+                anchor = f"s{section_count}"
+                for path in image_paths:
+                    name = os.path.basename(path)
+                    if os.path.exists(path) and name not in stored:
+                        epub.write(path, f"OEBPS/images/{name}", zipfile.ZIP_STORED)
+                        images.append(name)
+                        stored.add(name)
+                chapter[0].append((anchor, title))
+                chapter[1].append(section_html(section, anchor, self.image_dimensions, "images/", lazy=False))
+            if chapter is not None:
+                write_chapter()
+
+            epub.writestr("OEBPS/nav.xhtml", self.nav_document(contents))
+            epub.writestr("OEBPS/content.opf", self.package_document(contents, images))
+        os.replace(tmp_path, self.output_epub)
+        print(f"EPUB created: {self.output_epub} with {section_count} sections in {len(contents)} chapters")
+        return section_count
@@ -0,0 +1,68 @@
+import queue
+import threading
+
+from metrics import span
+
+# Streams sections to several output formats in one pass. The bundle is read
+# and deduplicated once, and each section tuple (blocks, image paths and all)
+# is handed to every sink as it is, so adding a format only adds that
+# format's own render time. Every sink runs in a thread of its own and takes
+# sections at its own pace; the queues are bounded so a slow sink holds the
+# others back instead of letting the whole manual pile up in memory
+QUEUE_SIZE = 64
+
+# Seconds between checks that a sink is still running while its queue is full
+PUT_TIMEOUT_SECONDS = 0.1
+
+END = object()
+
+
+class SinkThread(threading.Thread):
+    def __init__(self, sink):
+        super().__init__(name=f"sink-{sink.name}", daemon=True)
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.result = None
+
+    def sections(self):
+        while True:
+            section = self.queue.get()
+            if section is END:
+                return
+            yield section
+
+    def run(self):
+        try:
+            with span(f"render_{self.sink.name}"):
+                self.result = self.sink.render(self.sections())
+        except Exception as e:
+            print(f"Error writing {self.sink.name}: {str(e)}")
+
+    def put(self, section):
+        # A sink that stopped early is skipped, not waited for
+        while self.is_alive():
+            try:
+                self.queue.put(section, timeout=PUT_TIMEOUT_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+
+def fan_out(sections, sinks):
+    # Returns each sink's result by name
+    if len(sinks) == 1:
+        # Nothing to share, so the sink runs here (and under --profile render)
+        with span(f"render_{sinks[0].name}"):
+            return {sinks[0].name: sinks[0].render(sections)}
+
+    threads = [SinkThread(sink) for sink in sinks]
+    for thread in threads:
+        thread.start()
+    for section in sections:
+        for thread in threads:
+            thread.put(section)
+    for thread in threads:
+        thread.put(END)
+    for thread in threads:
+        thread.join()
+    return {thread.sink.name: thread.result for thread in threads}
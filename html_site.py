@@ -0,0 +1,227 @@
+import json
+import os
+import re
+from html import escape
+
+from blocks import WARNING_KINDS
+from image_store import display_size
+from manuals import MANUAL_TITLE
+from search_index import BM25_B, BM25_K1, DEFAULT_LIMIT
+from section_bundle import add_blob
+from settings import SITE_DIR
+
+# The manual as a static site that works offline, straight from the disk:
+#   index.html        title and table of contents
+#   chapter-NNN.html  one page per top-level chapter
+#   search.html       search over search_data.js, ranked like the CLI search
+#   blobs/            the bundle's images, hard linked where possible
+# Images load lazily and carry their size, so long chapters open quickly and
+# do not jump around while the images arrive
+STYLESHEET = "style.css"
+SEARCH_DATA = "search_data.js"
+CHAPTER_PATTERN = re.compile(r"chapter-(\d+)\.html$")
+
+STYLE = """body { font-family: sans-serif; max-width: 46em; margin: 0 auto; padding: 1em; line-height: 1.5; }
+img { max-width: 100%; height: auto; display: block; margin: 1em 0; }
+table { border-collapse: collapse; margin: 1em 0; }
+td { border: 1px solid #999; padding: 0.3em 0.5em; vertical-align: top; }
+.note { border: 1px solid #999; background: #f2f2f2; padding: 0.5em 0.8em; margin: 1em 0; }
+.note.warning { border-color: #c0392b; background: #fdecea; }
+ul.contents { list-style: none; padding: 0; }
+li.level-2 { margin-left: 1.5em; }
+li.level-3 { margin-left: 3em; }
+nav.pager { display: flex; justify-content: space-between; margin: 2em 0; }
+.result p { margin-top: 0; color: #444; }
+"""
+
+SEARCH_SCRIPT = """// BM25 over SEARCH_DOCS ([title, href, text]); "quoted phrases" must match
+var K1 = %(k1)s, B = %(b)s, LIMIT = %(limit)s;
+function tokenize(text) { return text.toLowerCase().match(/[\\p{L}\\p{N}_]+/gu) || []; }
+var postings = {}, lengths = [], total = 0, tokens = [];
+SEARCH_DOCS.forEach(function (doc, id) {
+  var words = tokenize(doc[0] + " " + doc[2]);
+  tokens.push(" " + words.join(" ") + " ");
+  lengths.push(words.length);
+  total += words.length;
+  words.forEach(function (word) {
+    var counts = postings[word] || (postings[word] = {});
+    counts[id] = (counts[id] || 0) + 1;
+  });
+});
+var average = total / (lengths.length || 1);
+function search(query) {
+  var phrases = (query.match(/"[^"]*"/g) || []).map(function (p) { return tokenize(p); });
+  var terms = tokenize(query.replace(/"[^"]*"/g, " "));
+  phrases.forEach(function (phrase) { terms = terms.concat(phrase); });
+  var scores = {};
+  Array.from(new Set(terms)).forEach(function (term) {
+    var docs = postings[term] || {}, ids = Object.keys(docs);
+    var idf = Math.log(1 + (lengths.length - ids.length + 0.5) / (ids.length + 0.5));
+    ids.forEach(function (id) {
+      var matches = phrases.every(function (p) {
+        return p.length < 2 || tokens[id].indexOf(" " + p.join(" ") + " ") >= 0;
+      });
+      if (!matches) return;
+      var norm = K1 * (1 - B + B * lengths[id] / (average || 1));
+      scores[id] = (scores[id] || 0) + idf * docs[id] * (K1 + 1) / (docs[id] + norm);
+    });
+  });
+  return Object.keys(scores).sort(function (a, b) { return scores[b] - scores[a] || a - b; }).slice(0, LIMIT);
+}
+function snippet(text, query) {
+  var word = tokenize(query)[0], at = word ? text.toLowerCase().indexOf(word) : 0;
+  return (at > 60 ? "\\u2026" : "") + text.slice(Math.max(0, at - 60), at + 140) + "\\u2026";
+}
+var query = new URLSearchParams(location.search).get("q") || "";
+document.getElementById("q").value = query;
+var results = document.getElementById("results");
+if (query) {
+  var ids = search(query);
+  if (!ids.length) results.textContent = "No results.";
+  ids.forEach(function (id) {
+    var doc = SEARCH_DOCS[id], item = document.createElement("div"), link = document.createElement("a");
+    var text = document.createElement("p");
+    item.className = "result";
+    link.href = doc[1];
+    link.textContent = doc[0];
+    text.textContent = snippet(doc[2], query);
+    item.appendChild(document.createElement("h3")).appendChild(link);
+    item.appendChild(text);
+    results.appendChild(item);
+  });
+}
+""" % {"k1": BM25_K1, "b": BM25_B, "limit": DEFAULT_LIMIT}
+
+SEARCH_FORM = '<form action="search.html"><input id="q" name="q" type="search" placeholder="Search"> ' \
+              '<button>Search</button></form>'
+
+
+def text_html(text):
+    return escape(text).replace("\n", "<br/>")
+
+
+def image_html(path, image_dimensions, image_prefix, lazy=True):
+    # Images are referenced under their blob name wherever they are stored
+    attributes = f'src="{image_prefix}{os.path.basename(path)}" alt=""'
+    if path in image_dimensions:
+        width, height = display_size(*image_dimensions[path])
+        attributes += f' width="{width}" height="{height}"'
+    if lazy:
+        attributes += ' loading="lazy" decoding="async"'
+    return f"<img {attributes}/>"
+
+
+def block_html(block, image_paths, image_dimensions, image_prefix, lazy=True):
+    # Markup valid as both HTML and XHTML, so the EPUB uses it as well
+    kind = block[0]
+    if kind == "paragraph":
+        return f"<p>{text_html(block[1])}</p>"
+    if kind == "list":
+        _, ordered, items = block
+        tag = "ol" if ordered else "ul"
+        return f"<{tag}>" + "".join(f"<li>{text_html(item)}</li>" for item in items) + f"</{tag}>"
+    if kind == "table":
+        return "<table>" + "".join("<tr>" + "".join(f"<td>{text_html(cell)}</td>" for cell in row) + "</tr>"
+                                   for row in block[1]) + "</table>"
+    if kind == "note":
+        _, note_kind, text = block
+        css_class = "note warning" if note_kind in WARNING_KINDS else "note"
+        return f'<div class="{css_class}"><strong>{escape(note_kind.upper())}:</strong> {text_html(text)}</div>'
+    if kind == "image":
+        return image_html(image_paths[block[1]], image_dimensions, image_prefix, lazy)
+    print(f"Unknown block type: {kind}")
+    return ""
+
+
+def section_html(section, anchor, image_dimensions, image_prefix, lazy=True):
+    level, title, _, image_paths, blocks = section
+    heading = f"h{min(level + 1, 4)}"
+    body = "".join(block_html(block, image_paths, image_dimensions, image_prefix, lazy) for block in blocks)
+    return f'<section id="{anchor}"><{heading}>{escape(title)}</{heading}>{body}</section>\n'
+
+
+def page_html(title, body):
+    return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"/>'
+            f'<meta name="viewport" content="width=device-width, initial-scale=1"/>'
+            f'<title>{escape(title)}</title><link rel="stylesheet" href="{STYLESHEET}"/></head>'
+            f'<body>\n{body}</body></html>\n')
+
+
+def chapter_file(number):
+    return f"chapter-{number:03d}.html"
+
+
+class HtmlSiteSink:
+    # Writes each chapter as soon as its last section has arrived, so only
+    # one chapter and the table of contents are held at a time
+    name = "html"
+
+    def __init__(self, site_dir=SITE_DIR, title=MANUAL_TITLE, image_dimensions=None):
+        self.site_dir = site_dir
+        self.title = title
+        self.image_dimensions = image_dimensions or {}
+
+    def write(self, name, content):
+        path = os.path.join(self.site_dir, name)
+        with open(f"{path}.tmp", 'w', encoding="utf-8") as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+
+    def write_chapter(self, number, chapter, chapter_count):
+        pager = []
+        pager.append(f'<a href="{chapter_file(number - 1)}">Previous</a>' if number > 1 else "<span></span>")
+        pager.append('<a href="index.html">Contents</a>')
+        pager.append(f'<a href="{chapter_file(number + 1)}">Next</a>' if number < chapter_count else "<span></span>")
+        pager = f'<nav class="pager">{"".join(pager)}</nav>\n'
+        self.write(chapter_file(number), page_html(chapter[0], SEARCH_FORM + pager + "".join(chapter[1]) + pager))
+
+    def render(self, sections):
+        os.makedirs(os.path.join(self.site_dir, "blobs"), exist_ok=True)
+        self.write(STYLESHEET, STYLE)
+
+        # A chapter's "next" link needs to know whether another one follows,
+        # so each chapter is written when the next one starts
+        contents = []
+        chapter = None
+        chapter_number = 0
+        section_count = 0
+        search_path = os.path.join(self.site_dir, SEARCH_DATA)
+        with open(f"{search_path}.tmp", 'w', encoding="utf-8") as search_data:
+            search_data.write("var SEARCH_DOCS = [\n")
+            for section in sections:
+                level, title, text, image_paths, _ = section
+                if chapter is None or level == 1:
+                    if chapter is not None:
+                        self.write_chapter(chapter_number, chapter, chapter_number + 1)
+                    chapter_number += 1
+                    chapter = (title, [])
+
+                section_count += 1
+                anchor = f"s{section_count}"
+                href = f"{chapter_file(chapter_number)}#{anchor}"
+                for path in image_paths:
+                    if os.path.exists(path):
+                        add_blob(self.site_dir, path)
+                chapter[1].append(section_html(section, anchor, self.image_dimensions, "blobs/"))
+                contents.append(f'<li class="level-{level}"><a href="{href}">{escape(title)}</a></li>')
+                if text:
+                    search_data.write(json.dumps([title, href, text], ensure_ascii=False) + ",\n")
+            search_data.write("];\n")
+        os.replace(f"{search_path}.tmp", search_path)
+        if chapter is not None:
+            self.write_chapter(chapter_number, chapter, chapter_number)
+
+        # Chapters left over from an earlier, longer manual are removed
+        for name in os.listdir(self.site_dir):
+            match = CHAPTER_PATTERN.match(name)
+            if match and int(match.group(1)) > chapter_number:
+                os.remove(os.path.join(self.site_dir, name))
+
+        header = f"<h1>{escape(self.title)}</h1>\n{SEARCH_FORM}\n"
+        self.write("index.html", page_html(self.title, header + '<ul class="contents">\n' + "\n".join(contents)
+                                           + "\n</ul>\n"))
+        scripts = f'<script src="{SEARCH_DATA}"></script><script src="search.js"></script>\n'
+        self.write("search.html", page_html(f"Search - {self.title}", header + '<div id="results"></div>\n' + scripts))
+        self.write("search.js", SEARCH_SCRIPT)
+        print(f"Site created: {self.site_dir}/ with {section_count} sections in {chapter_number} chapters")
+        return section_count
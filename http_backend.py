@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+from urllib.parse import urljoin
+
+import aiohttp
+
+from metrics import count, span
+from scheduler import AdaptiveLimiter, run_with_retries
+from topic_extract import extract_topic
+
+# Seconds before an idle keep-alive connection is closed, and before a single
+# request is given up on
+KEEPALIVE_SECONDS = 30
+REQUEST_TIMEOUT_SECONDS = 60
+
+
+def open_session(concurrency):
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=KEEPALIVE_SECONDS)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+class HttpBackend:
+    # Downloads topic documents and images directly over a pooled keep-alive
+    # connection, with no browser involved
+    name = "http"
+
+    def __init__(self, url, concurrency, session=None, limiter=None):
+        # Manuals crawled together pass in one session and limiter, and with
+        # them one connection pool; the session is then theirs to close
+        self.url = url
+        self.concurrency = concurrency
+        self.session = session
+        self.owns_session = session is None
+        self.limiter = limiter or AdaptiveLimiter(concurrency, concurrency)
+
+    async def __aenter__(self):
+        if self.owns_session:
+            self.session = open_session(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.owns_session:
+            await self.session.close()
+
+    async def fetch(self, url, etag=None, last_modified=None):
+        # Returns the body and its validators. With validators from an earlier
+        # download the request is conditional, and the body is None when the
+        # server answers 304 Not Modified. Every request, topic or image,
+        # takes a limiter slot of its own and is retried on its own, so the
+        # limiter sees single request latencies and caps all of them together
+        return await run_with_retries(self.limiter, lambda: self.request(url, etag, last_modified), url)
+
+    async def request(self, url, etag, last_modified):
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        async with self.session.get(url, headers=headers) as response:
+            if response.status == 304:
+                count("not_modified")
+                return None, {"etag": etag, "last_modified": last_modified}
+            response.raise_for_status()
+            validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+            data = await response.read()
+        count("bytes_transferred", len(data))
+        return data, validators
+
+    async def get(self, url):
+        return (await self.fetch(url))[0]
+
+    async def fetch_manifest_html(self):
+        return (await self.get(self.url)).decode("utf-8", errors="replace")
+
+    async def open_workers(self, count):
+        # Workers share the session; the connector caps open connections
+        return [self] * count
+
+    async def fetch_topic(self, topic):
+        topic_url = urljoin(self.url, topic.url)
+        with span("http_topic"):
+            html, validators = await self.fetch(topic_url)
+        with span("extract_topic"):
+            text, image_urls, blocks = extract_topic(html, topic_url)
+
+        with span("http_images"):
+            responses = await asyncio.gather(*(self.fetch(image_url) for image_url in image_urls))
+        images = [dict(image_validators, filename=f"image_{idx}.png", data=data, how="http", url=image_url)
+                  for idx, (image_url, (data, image_validators)) in enumerate(zip(image_urls, responses))]
+
+        sources = dict(validators, source_hash=hashlib.sha256(html).hexdigest())
+        return text, images, sources, blocks
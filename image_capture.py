@@ -0,0 +1,29 @@
+class ImageCapture:
+    # Keeps the original image responses a page receives so the crawler can
+    # store their bytes as served, instead of redrawing each image on a canvas
+    # and shipping it back as a base64 data URL
+    def __init__(self, page):
+        self.page = page
+        self.responses = {}
+        page.on("response", self.on_response)
+
+    def on_response(self, response):
+        content_type = response.headers.get("content-type", "")
+        if response.ok and content_type.startswith("image/"):
+            self.responses[response.url] = response
+
+    def clear(self):
+        self.responses.clear()
+
+    async def fetch(self, url):
+        response = self.responses.pop(url, None)
+        if response is not None:
+            return await response.body(), "captured"
+
+        # Images served from the browser's memory cache never show up as
+        # responses, so request them again through the context, which shares
+        # the page's cookies and HTTP cache
+        response = await self.page.context.request.get(url)
+        if not response.ok:
+            raise RuntimeError(f"HTTP {response.status} fetching {url}")
+        return await response.body(), "requested"
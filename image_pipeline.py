@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from metrics import add_time, count
+from settings import JPEG_QUALITY
+
+# Images waiting for or being encoded at any one time. Once this many are in
+# flight the crawler waits for a free slot, which keeps memory bounded
+DEFAULT_MAX_PENDING = (os.cpu_count() or 1) * 2
+
+
+def transcode_to_jpeg(image_data, output_path, quality=JPEG_QUALITY, max_size=None):
+    # Runs in a worker process, so PIL is imported there rather than in the crawler
+    from PIL import Image as PILImage
+
+    start = time.perf_counter()
+    # Convert PNG to JPEG, scale it down to max_size and reduce quality
+    image = PILImage.open(BytesIO(image_data)).convert("RGB")
+    if max_size:
+        image.thumbnail(max_size, PILImage.LANCZOS)
+    jpeg_image = BytesIO()
+    image.save(jpeg_image, format="JPEG", quality=quality, optimize=True)
+
+    # Write to a temporary file first: a non-empty file at output_path counts
+    # as stored, so a crash mid-write must never leave a truncated one there
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as handler:
+        handler.write(jpeg_image.getvalue())
+    os.replace(tmp_path, output_path)
+    # The parent process records the timing, metrics kept here would be lost
+    return output_path, time.perf_counter() - start, image.size
+
+
+class ImageEncoder:
+    def __init__(self, max_workers=None, max_pending=DEFAULT_MAX_PENDING):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.slots = asyncio.Semaphore(max_pending)
+        self.queue_depth = 0
+
+    async def submit(self, image_data, output_path, quality=JPEG_QUALITY, max_size=None):
+        # Blocks only while the queue is full, the encode itself runs in the pool
+        await self.slots.acquire()
+        self.queue_depth += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, transcode_to_jpeg, image_data, output_path, quality, max_size)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        self.queue_depth -= 1
+        self.slots.release()
+        if not future.cancelled() and future.exception() is None:
+            add_time("jpeg_encode", future.result()[1])
+            count("images_encoded")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,117 @@
+import hashlib
+import os
+
+from crawl_cache import read_json, write_json
+from metrics import count
+from settings import DEFAULT_IMAGE_PROFILE, IMAGE_PROFILES, MAX_IMAGE_SIZE
+
+# Pixel size of every stored image by file name, kept next to the images so
+# nothing downstream has to open an image just to lay it out
+DIMENSIONS_FILE = "dimensions.json"
+
+
+def max_pixels(dpi):
+    return tuple(round(points * dpi / 72) for points in MAX_IMAGE_SIZE)
+
+
+def display_size(width, height):
+    # Size an image is drawn at, in points (or CSS pixels): scaled to fit
+    # MAX_IMAGE_SIZE, the same in every output format
+    max_width, max_height = MAX_IMAGE_SIZE
+    scale_factor = min(max_width / width, max_height / height)
+    return int(width * scale_factor), int(height * scale_factor)
+
+
+def image_key(image_data):
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def stored_dimensions(image_path, loaded):
+    # loaded caches each directory's dimensions file between calls
+    image_dir = os.path.dirname(image_path)
+    if image_dir not in loaded:
+        loaded[image_dir] = read_json(os.path.join(image_dir, DIMENSIONS_FILE)) or {}
+
+    size = loaded[image_dir].get(os.path.basename(image_path))
+    if size is None:
+        # Stored before sizes were recorded, the header is enough
+        from PIL import Image as PILImage
+        with PILImage.open(image_path) as img:
+            size = loaded[image_dir][os.path.basename(image_path)] = img.size
+        count("images_opened")
+    return tuple(size)
+
+
+class ImageStore:
+    # Content-addressed image directory: each distinct image is stored and
+    # encoded once as <sha256 of the original bytes>.jpeg, and sections only
+    # hold the path. The same warning icon used by dozens of topics therefore
+    # ends up as a single file and a single image in the PDF. Each image
+    # profile has its own subdirectory, since the same source image is
+    # stored at a different size for each
+    def __init__(self, image_dir, image_encoder, profile=DEFAULT_IMAGE_PROFILE):
+        self.image_dir = os.path.join(image_dir, profile)
+        self.image_encoder = image_encoder
+        self.quality = IMAGE_PROFILES[profile]["quality"]
+        self.max_size = max_pixels(IMAGE_PROFILES[profile]["dpi"])
+        self.encoding = {}
+        self.duplicates = 0
+        os.makedirs(self.image_dir, exist_ok=True)
+        self.dimensions = read_json(os.path.join(self.image_dir, DIMENSIONS_FILE)) or {}
+
+    def path_for(self, key):
+        return os.path.join(self.image_dir, f"{key}.jpeg")
+
+    async def add(self, image_data):
+        # Returns the stored path and, when the image still has to be written,
+        # the future of its encode
+        key = image_key(image_data)
+        path = self.path_for(key)
+
+        # Another topic is encoding the same image right now
+        if key in self.encoding:
+            self.duplicates += 1
+            count("duplicates_skipped")
+            return path, self.encoding[key]
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.duplicates += 1
+            count("duplicates_skipped")
+            return path, None
+
+        # Registered before waiting for an encode slot, so a topic with the
+        # same image arriving meanwhile waits for this encode instead of
+        # starting a second one that writes the same file
+        # (asyncio is imported here: stats and the renderer load this module
+        # too, and start faster without it)
+        import asyncio
+
+        placeholder = asyncio.get_running_loop().create_future()
+        self.encoding[key] = placeholder
+        try:
+            future = await self.image_encoder.submit(image_data, path, self.quality, self.max_size)
+        except Exception as e:
+            self.encoding.pop(key, None)
+            placeholder.set_exception(e)
+            # Raised to this caller; topics waiting on it get it from the future
+            placeholder.exception()
+            raise
+        except BaseException:
+            self.encoding.pop(key, None)
+            placeholder.cancel()
+            raise
+        future.add_done_callback(lambda done: self.finish(key, done, placeholder))
+        return path, placeholder
+
+    def finish(self, key, future, placeholder):
+        self.encoding.pop(key, None)
+        if future.cancelled():
+            placeholder.cancel()
+        elif future.exception() is not None:
+            placeholder.set_exception(future.exception())
+        else:
+            self.dimensions[os.path.basename(future.result()[0])] = future.result()[2]
+            placeholder.set_result(future.result())
+
+    def save_dimensions(self):
+        write_json(os.path.join(self.image_dir, DIMENSIONS_FILE), self.dimensions)
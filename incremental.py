@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import os
+from collections import namedtuple
+
+import crawl_cache
+from image_store import image_key
+from metrics import count
+from nav_index import load_manifest
+
+# What an update run found before crawling: the current manifest, the topics
+# whose cached copy is out of date (with their content hash at the time, to
+# tell real changes from documents that were merely re-served), and the topic
+# URLs added to or removed from the navigation
+UpdateCheck = namedtuple("UpdateCheck", ["manifest", "stale", "previous_hashes", "added", "removed"])
+
+
+def diff_manifests(previous, current):
+    previous_urls = {topic.url for topic in previous if topic.url}
+    current_urls = {topic.url for topic in current if topic.url}
+    added = [topic.url for topic in current if topic.url and topic.url not in previous_urls]
+    removed = [topic.url for topic in previous if topic.url and topic.url not in current_urls]
+    return added, removed
+
+
+async def image_unchanged(backend, image):
+    # Stored images are named after the hash of the bytes they were made
+    # from, so a re-served image can be compared without decoding it
+    if not image.get("url"):
+        return False
+    data, validators = await backend.fetch(image["url"], image.get("etag"), image.get("last_modified"))
+    if data is not None and image_key(data) != os.path.splitext(os.path.basename(image["path"]))[0]:
+        return False
+    image.update(validators)
+    return True
+
+
+async def topic_unchanged(backend, entry, image_checks):
+    # A 304, or a 200 with the same HTML as last time, means the topic is
+    # unchanged; its images are checked the same way
+    data, validators = await backend.fetch(entry["url"], entry.get("etag"), entry.get("last_modified"))
+    if data is not None and hashlib.sha256(data).hexdigest() != entry.get("source_hash"):
+        return False
+
+    # Images shared between topics are only checked once
+    for image in entry["images"]:
+        key = image.get("url") or image["path"]
+        if key not in image_checks:
+            image_checks[key] = asyncio.ensure_future(image_unchanged(backend, image))
+        if not await image_checks[key]:
+            return False
+
+    entry.update(validators)
+    return True
+
+
+async def check_for_updates(backend, root_url, previous_manifest, limit_manifest):
+    # Every check goes through backend.fetch, so it takes a slot of the
+    # session's shared limiter and is retried like a crawl request: an update
+    # run keeps to --concurrency, and a passing 503 does not make a topic stale
+    manifest = load_manifest(await backend.fetch_manifest_html())
+    crawl_cache.save_manifest(crawl_cache.CACHE_DIR, root_url, manifest)
+    manifest = limit_manifest(manifest)
+    added, removed = diff_manifests(limit_manifest(previous_manifest), manifest)
+
+    image_checks = {}
+    stale = set()
+    previous_hashes = {}
+
+    async def check(topic):
+        entry = crawl_cache.load_topic_entry(crawl_cache.CACHE_DIR, root_url, topic)
+        if entry is None:
+            # New or never fetched, the crawl picks it up anyway
+            return
+        try:
+            unchanged = await topic_unchanged(backend, entry, image_checks)
+        except Exception as e:
+            print(f"Error checking {topic.url} for changes: {str(e)}")
+            unchanged = False
+
+        if unchanged:
+            # Keep any refreshed validators for the next run
+            crawl_cache.save_topic_entry(crawl_cache.CACHE_DIR, entry)
+            count("topics_unchanged")
+        else:
+            stale.add(topic.url)
+            previous_hashes[topic.url] = entry["content_hash"]
+
+    await asyncio.gather(*(check(topic) for topic in manifest if topic.url))
+    return UpdateCheck(manifest, stale, previous_hashes, added, removed)
+
+
+def changed_topics(root_url, update_check):
+    # Stale topics whose re-fetched content actually differs
+    changed = []
+    for topic in update_check.manifest:
+        if topic.url in update_check.stale:
+            entry = crawl_cache.load_topic_entry(crawl_cache.CACHE_DIR, root_url, topic)
+            if entry is None or entry["content_hash"] != update_check.previous_hashes[topic.url]:
+                changed.append(topic.url)
+    return changed
+
+
+def print_change_report(root_url, update_check):
+    titles = {topic.url: topic.title for topic in update_check.manifest}
+    changed = changed_topics(root_url, update_check)
+    count("topics_changed", len(changed))
+    count("topics_added", len(update_check.added))
+    count("topics_removed", len(update_check.removed))
+
+    print(f"Update: {len(changed)} changed, {len(update_check.added)} added, {len(update_check.removed)} removed")
+    for label, urls in (("Changed", changed), ("Added", update_check.added), ("Removed", update_check.removed)):
+        for url in urls:
+            print(f"  {label}: {titles.get(url, url)} ({url})")
+    return bool(changed or update_check.added or update_check.removed)
@@ -0,0 +1,66 @@
+import os
+from collections import namedtuple
+
+from settings import (BUNDLE_DIR, CACHE_DIR, DEDUPE_LOG, DEFAULT_LOCALE, DEFAULT_MODEL, MANUAL_URL_TEMPLATE,
+                      OUTPUT_EPUB, OUTPUT_PDF, SEARCH_INDEX, SITE_DIR)
+
+# One manual per model and locale. Each gets its own bundle, outputs, search
+# index and dedupe log; the crawl cache is keyed by URL and the image store by
+# content, so both are shared as they are
+Manual = namedtuple("Manual", ["model", "locale", "url", "title", "bundle_dir", "output_pdf", "search_index",
+                               "output_epub", "site_dir", "dedupe_log"])
+
+MANUAL_TITLE = "Fisker Ocean Manual"
+
+
+def manual_for(model=DEFAULT_MODEL, locale=DEFAULT_LOCALE):
+    url = MANUAL_URL_TEMPLATE.format(model=model, locale=locale)
+    if (model, locale) == (DEFAULT_MODEL, DEFAULT_LOCALE):
+        # Where a single-manual run has always put things
+        return Manual(model, locale, url, MANUAL_TITLE, BUNDLE_DIR, OUTPUT_PDF, SEARCH_INDEX, OUTPUT_EPUB, SITE_DIR,
+                      DEDUPE_LOG)
+
+    # Next to the default manual's directories rather than inside them, so
+    # rendering or cleaning up one manual never touches another's files
+    slug = f"{model}-{locale}".lower()
+    return Manual(model, locale, url, f"Fisker {model} Manual ({locale})", f"{BUNDLE_DIR}_{slug}",
+                  f"fisker_{model.lower()}_manual_{locale.lower()}.pdf",
+                  os.path.join(CACHE_DIR, f"search_index_{slug}.bin"),
+                  f"fisker_{model.lower()}_manual_{locale.lower()}.epub", f"{SITE_DIR}_{slug}",
+                  os.path.join(CACHE_DIR, f"dedupe_log_{slug}.jsonl"))
+
+
+def manual_outputs(manual, formats):
+    # {format: path} of what a render writes for the manual
+    paths = {"pdf": manual.output_pdf, "html": manual.site_dir, "epub": manual.output_epub}
+    return {output_format: paths[output_format] for output_format in formats}
+
+
+def parse_manual(value):
+    # "Ocean/de-de" on the command line
+    model, locale = value.split("/")
+    if not model or not locale:
+        raise ValueError(value)
+    return manual_for(model, locale)
+
+
+# Manual fields that can be set from the command line, by option name
+PATH_OPTIONS = {"bundle_dir": "bundle", "output_pdf": "output", "output_epub": "epub", "site_dir": "site"}
+
+
+def selected_manuals(args):
+    # The manuals a command runs on: every --manual given, or the default one.
+    # --bundle and the output paths only make sense for a single manual
+    manuals = list(args.manual or [manual_for()])
+    paths = {field: getattr(args, option, None) for field, option in PATH_OPTIONS.items()}
+    if any(paths.values()):
+        if len(manuals) > 1:
+            raise ValueError("--bundle, --output, --epub and --site can only be used with a single manual")
+        manuals[0] = manuals[0]._replace(**{field: path for field, path in paths.items() if path})
+    return manuals
+
+
+def add_manual_argument(parser):
+    parser.add_argument("--manual", type=parse_manual, action="append", metavar="MODEL/LOCALE",
+                        help=f"manual to work on, e.g. {DEFAULT_MODEL}/de-de; repeat it to batch several "
+                             f"(default: {DEFAULT_MODEL}/{DEFAULT_LOCALE})")
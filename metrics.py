@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Each run writes one file here: counters, per-phase timing totals, and every
+# span as a Chrome trace event, so a run can be opened in chrome://tracing or
+# Perfetto to see where the time went
+METRICS_DIR = "metrics"
+
+PROFILE_LINES = 25
+
+
+class Metrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        # Milliseconds and the process id keep runs started in the same
+        # second, such as two render commands back to back, from sharing files
+        self.run_name = (time.strftime("run-%Y%m%d-%H%M%S", time.localtime(self.started_at))
+                         + f"-{int(self.started_at * 1000) % 1000:03d}-{os.getpid()}")
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(lambda: {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        self.events = []
+        self.lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def add_time(self, name, seconds, start=None, **args):
+        # For work timed elsewhere, e.g. in a worker process
+        with self.lock:
+            timing = self.timings[name]
+            timing["count"] += 1
+            timing["total_seconds"] += seconds
+            timing["max_seconds"] = max(timing["max_seconds"], seconds)
+            if start is not None:
+                self.events.append({
+                    "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                    "ts": round((start - self.started) * 1e6), "dur": round(seconds * 1e6), "args": args,
+                })
+
+    @contextmanager
+    def span(self, name, **args):
+        # Spans of concurrent tasks overlap, so a phase's total can be more
+        # than the wall-clock time it took
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, start, **args)
+
+    def summary(self):
+        return {
+            "started_at": self.started_at,
+            "elapsed_seconds": round(time.perf_counter() - self.started, 3),
+            "counters": dict(sorted(self.counters.items())),
+            "timings": {name: {key: round(value, 4) for key, value in timing.items()}
+                        for name, timing in sorted(self.timings.items())},
+        }
+
+    def write(self, metrics_dir=METRICS_DIR):
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(metrics_dir, f"{self.run_name}.json")
+        data = self.summary()
+        data["traceEvents"] = self.events
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        return path
+
+    def report(self):
+        summary = self.summary()
+        print(f"Finished in {summary['elapsed_seconds']:.1f}s")
+        for name, timing in summary["timings"].items():
+            print(f"  {name:<20} {timing['count']:>6}x {timing['total_seconds']:>9.3f}s total "
+                  f"{timing['max_seconds']:>8.3f}s max")
+        for name, value in summary["counters"].items():
+            print(f"  {name:<20} {value:>10}")
+
+
+# One collector per run, shared by every module
+metrics = Metrics()
+span = metrics.span
+count = metrics.count
+add_time = metrics.add_time
+
+profiled_phases = set()
+
+
+@contextmanager
+def profile(phase, metrics_dir=METRICS_DIR):
+    # Runs the phase under cProfile if it was asked for with --profile, saves
+    # the stats next to the metrics file and prints the most expensive calls
+    if phase not in profiled_phases:
+        yield
+        return
+
+    # Only loaded when asked for, most runs never profile anything
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(metrics_dir, f"{metrics.run_name}-{phase}.prof")
+        # A phase that runs more than once, such as the render of each of
+        # several manuals, gets a numbered file each time
+        number = 1
+        while os.path.exists(path):
+            number += 1
+            path = os.path.join(metrics_dir, f"{metrics.run_name}-{phase}-{number}.prof")
+        profiler.dump_stats(path)
+
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        print(f"Profile of the {phase} phase saved to {path}")
+        print(output.getvalue())
@@ -0,0 +1,252 @@
+import argparse
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from nav_index import SIDE_NAV_DATA_START, parse_side_nav_data
+
+# A stand-in for the manual site: owner_guide.html is menu.html with its
+# sideNavData cut down to the requested number of topics, and every topic and
+# image is generated on the fly. Used by benchmark.py, and handy on its own
+# for trying changes without hitting fiskerinc.com
+
+MENU_HTML = "menu.html"
+
+# Stand-in for each stylesheet, script and font the real pages pull in
+ASSET_SIZE = 40 * 1024
+ASSET_TYPES = {".css": "text/css", ".js": "application/javascript", ".woff2": "font/woff2"}
+
+WORDS = ("vehicle battery charge drive mode door seat mirror display warning "
+         "press hold button select screen system safety brake wheel tire light "
+         "camera sensor key phone app setting service").split()
+
+
+def make_png(width, height, seed):
+    # Small deterministic RGB PNG, written by hand so the server needs no PIL
+    rng = random.Random(seed)
+    base = [rng.randrange(256) for _ in range(3)]
+    rows = []
+    for y in range(height):
+        row = bytearray(b"\x00")
+        for x in range(width):
+            row += bytes(((base[0] + x) % 256, (base[1] + y) % 256, (base[2] + x * y) % 256))
+        rows.append(bytes(row))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"".join(rows))) + chunk(b"IEND", b""))
+
+
+def limit_nav_data(nav_data, topic_limit):
+    # Keeps the tree shape but drops every topic after the first topic_limit
+    remaining = [topic_limit]
+
+    def prune(items):
+        kept = []
+        for item in items:
+            if item["url"]:
+                if remaining[0] <= 0:
+                    continue
+                remaining[0] -= 1
+                kept.append(item)
+            else:
+                children = prune(item["childItems"])
+                if children or not item["childItems"]:
+                    kept.append(dict(item, childItems=children))
+        return kept
+
+    return prune(nav_data)
+
+
+class MockManual:
+    def __init__(self, topics=316, images_per_topic=2, image_size=(320, 240),
+                 distinct_images=50, paragraphs=6, latency=0.0, error_rate=0.0):
+        with open(MENU_HTML, encoding="utf-8") as f:
+            menu_html = f.read()
+
+        nav_data = limit_nav_data(parse_side_nav_data(menu_html), topics)
+        start = menu_html.index(SIDE_NAV_DATA_START) + len(SIDE_NAV_DATA_START)
+        end = menu_html.index("];", start) + 1
+        self.owner_guide = (menu_html[:start] + json.dumps(nav_data, indent=1) + menu_html[end:]).encode()
+
+        self.topics = {}
+        self.collect_topics(nav_data)
+        self.images_per_topic = images_per_topic
+        self.distinct_images = distinct_images
+        self.paragraphs = paragraphs
+        self.latency = latency
+        # Share of topic and image requests answered with 503, like a server
+        # shedding load
+        self.error_rate = error_rate
+        self.errors = random.Random(0)
+
+        # Generated up front so image encoding does not count as server time
+        self.images = {image_id: make_png(*image_size, seed=image_id) for image_id in range(distinct_images)}
+
+        # Bumping a topic's revision changes its text, like an edit to the
+        # manual. Every response carries an ETag and honours If-None-Match
+        self.revisions = {}
+        self.last_modified = formatdate(time.time(), usegmt=True)
+
+        self.lock = threading.Lock()
+        self.requests = {"owner_guide": 0, "topic": 0, "image": 0, "asset": 0, "not_modified": 0, "error": 0, "other": 0}
+        self.bytes_sent = 0
+
+    def collect_topics(self, items):
+        for item in items:
+            if item["url"]:
+                self.topics[item["url"]] = (len(self.topics), " ".join(item["navItem"].split()))
+            self.collect_topics(item["childItems"])
+
+    def topic_html(self, index, title):
+        rng = random.Random(index)
+        body = []
+        if self.revisions.get(index):
+            body.append(f"<p>Revision {self.revisions[index]}.</p>")
+        for _ in range(self.paragraphs):
+            body.append("<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))) + ".</p>")
+
+        # The real topics also have warnings, step lists and spec tables
+        def phrase():
+            return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+        if index % 2 == 0:
+            body.append(f'<div class="warning"><p><b>WARNING:</b> {phrase()}.</p></div>')
+        if index % 3 == 0:
+            body.append("<ol>" + "".join(f"<li>{phrase()}.</li>" for _ in range(rng.randint(2, 6))) + "</ol>")
+        if index % 5 == 0:
+            body.append("<table>" + "".join(f"<tr><td>{phrase()}</td><td>{phrase()}</td></tr>"
+                                            for _ in range(rng.randint(2, 5))) + "</table>")
+
+        # Some images repeat across topics, like the manual's warning icons
+        for i in range(self.images_per_topic):
+            image_id = (index * self.images_per_topic + i) % self.distinct_images
+            body.insert(min(len(body), i * 2 + 1),
+                        f'<object type="image/png" data="images/mock_{image_id}.png"></object>')
+
+        # Like the real topics, each one pulls in the shared stylesheets and a font
+        head = ('<link rel="stylesheet" href="../../css/content.css">'
+                '<link rel="stylesheet" href="../../css/owner.info.css">'
+                '<style>@font-face { font-family: Manual; src: url("../../fonts/manual.woff2"); } '
+                'body { font-family: Manual; }</style>')
+        return (f"<html><head><title>{title}</title>{head}</head><body>"
+                f"<h1>{title}</h1>{''.join(body)}</body></html>").encode()
+
+    def respond(self, path):
+        # Returns (kind, content type, body) for a request path, or None for 404
+        name = path.split("?")[0].rsplit("/", 1)[-1]
+        if name == "owner_guide.html":
+            return "owner_guide", "text/html", self.owner_guide
+        if name in self.topics:
+            return "topic", "text/html", self.topic_html(*self.topics[name])
+        if name.startswith("mock_") and name.endswith(".png"):
+            image = self.images.get(int(name[5:-4]))
+            return None if image is None else ("image", "image/png", image)
+        extension = "." + name.rsplit(".", 1)[-1]
+        if extension in ASSET_TYPES:
+            # A comment is valid as both CSS and JavaScript
+            return "asset", ASSET_TYPES[extension], b"/*" + b" " * (ASSET_SIZE - 4) + b"*/"
+        return None
+
+    def should_fail(self):
+        with self.lock:
+            return self.errors.random() < self.error_rate
+
+    def count(self, kind, size):
+        with self.lock:
+            self.requests[kind] += 1
+            self.bytes_sent += size
+
+
+def make_handler(manual):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if manual.latency:
+                time.sleep(manual.latency)
+
+            response = manual.respond(self.path)
+            if response is None:
+                manual.count("other", 0)
+                self.send_error(404)
+                return
+
+            kind, content_type, body = response
+            if kind in ("topic", "image") and manual.should_fail():
+                manual.count("error", 0)
+                self.send_error(503)
+                return
+
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                manual.count("not_modified", 0)
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            manual.count(kind, len(body))
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", manual.last_modified)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(manual, port=0):
+    # Runs in a background thread; returns the server and the manual's root URL
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(manual))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/owners_manual/Ocean/content/en-us/owner_guide.html"
+    return server, url
+
+
+def parse_size(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def add_manual_arguments(parser):
+    parser.add_argument("--topics", type=int, default=316, help="number of topics (default: 316)")
+    parser.add_argument("--images-per-topic", type=int, default=2, help="images in each topic (default: 2)")
+    parser.add_argument("--image-size", type=parse_size, default=(320, 240), help="image size as WxH (default: 320x240)")
+    parser.add_argument("--distinct-images", type=int, default=50, help="number of different images (default: 50)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of topic and image requests that fail with 503 (default: 0)")
+
+
+def manual_from_args(args):
+    return MockManual(topics=args.topics, images_per_topic=args.images_per_topic, image_size=args.image_size,
+                      distinct_images=args.distinct_images, latency=args.latency, error_rate=args.error_rate)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic Fisker manual on localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    add_manual_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_server(manual_from_args(args), args.port)
+    print(f"Serving mock manual at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,61 @@
+import json
+import re
+from collections import namedtuple
+
+# One entry of the side navigation. Chapters and sections only carry a title
+# (url is empty); the 316 real topics carry the document they load, e.g. EX.html
+Topic = namedtuple("Topic", ["level", "title", "url", "parent"])
+
+SIDE_NAV_DATA_START = "let sideNavData = "
+
+
+def clean_title(title):
+    # Some nav titles contain long runs of whitespace left over from the HTML source
+    return " ".join(title.split())
+
+
+def parse_side_nav_data(html):
+    start = html.find(SIDE_NAV_DATA_START)
+    if start == -1:
+        raise ValueError("sideNavData not found in page")
+    start += len(SIDE_NAV_DATA_START)
+    end = html.index("];", start) + 1
+
+    # sideNavData is a JavaScript literal: quote the keys and drop trailing
+    # commas so it can be read as JSON
+    literal = html[start:end]
+    literal = re.sub(r'([{,]\s*)(\w+)\s*:', r'\1"\2":', literal)
+    literal = re.sub(r',(\s*[\]}])', r'\1', literal)
+    return json.loads(literal)
+
+
+def build_manifest(nav_data, level=1, parent=None):
+    manifest = []
+    for item in nav_data:
+        title = clean_title(item.get("navItem", ""))
+        url = item.get("url", "")
+        children = item.get("childItems") or []
+
+        # The first entry holds the search form and has nothing to render
+        if not url and not children:
+            continue
+
+        manifest.append(Topic(level, title, url, parent))
+        manifest.extend(build_manifest(children, level + 1, title))
+    return manifest
+
+
+def load_manifest(html):
+    return build_manifest(parse_side_nav_data(html))
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "menu.html"
+    with open(path, encoding="utf-8") as f:
+        manifest = load_manifest(f.read())
+
+    for topic in manifest:
+        print(f"{'  ' * (topic.level - 1)}{topic.title} {topic.url}".rstrip())
+    print(f"{len(manifest)} entries, {sum(1 for t in manifest if t.url)} topics")
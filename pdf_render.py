@@ -0,0 +1,349 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+from reportlab.platypus import (SimpleDocTemplate, Paragraph, Spacer, Image, ListFlowable, ListItem, Table,
+                                TableStyle)
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+from PIL import Image as PILImage
+
+from blocks import WARNING_KINDS
+from crawl_cache import read_json, write_json
+from image_store import display_size
+from manuals import MANUAL_TITLE
+from metrics import add_time, count, span
+from pdf_stream import FlowableStream
+from settings import CACHE_DIR, OUTPUT_PDF
+
+# Rendered chapters are cached here by content hash. Bump RENDER_VERSION
+# whenever the layout changes so stale chapters are not reused
+CHAPTER_CACHE_DIR = os.path.join(CACHE_DIR, "chapters")
+RENDER_VERSION = 2
+
+# Sections are set in Heading2-Heading4 (Heading1 is the title page style),
+# which map onto the top three levels of the PDF outline
+OUTLINE_LEVELS = {'Heading2': 0, 'Heading3': 1, 'Heading4': 2}
+
+# Width of the page's frame: letter with SimpleDocTemplate's one inch margins
+FRAME_WIDTH = letter[0] - 2 * inch
+TABLE_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+@lru_cache(maxsize=None)
+def build_styles():
+    # Built once per process; every section and chapter shares the styles
+    styles = getSampleStyleSheet()
+
+    # Create custom styles only if they don't exist
+    custom_styles = [
+        ('Heading1', 18, 12),
+        ('Heading2', 16, 10),
+        ('Heading3', 14, 8),
+        ('Heading4', 12, 6)
+    ]
+
+    for name, font_size, space_after in custom_styles:
+        if name not in styles:
+            styles.add(ParagraphStyle(name=name, fontSize=font_size, spaceAfter=space_after, keepWithNext=True))
+
+    styles.add(ParagraphStyle(name='ListItem', parent=styles['BodyText'], spaceBefore=0, spaceAfter=2))
+    styles.add(ParagraphStyle(name='TableCell', parent=styles['BodyText'], fontSize=9, leading=11,
+                              spaceBefore=0, spaceAfter=0))
+    styles.add(ParagraphStyle(name='Note', parent=styles['BodyText'], borderWidth=0.5, borderPadding=6,
+                              borderColor=colors.grey, backColor=colors.HexColor('#f2f2f2'),
+                              leftIndent=6, rightIndent=6))
+    styles.add(ParagraphStyle(name='Warning', parent=styles['Note'], borderColor=colors.HexColor('#c0392b'),
+                              backColor=colors.HexColor('#fdecea')))
+
+    return styles
+
+def title_flowables(styles, title=MANUAL_TITLE):
+    title_style = ParagraphStyle(name='Title', parent=styles['Heading1'], alignment=TA_CENTER)
+    return [Paragraph(escape(title), title_style), Spacer(1, 36)]
+
+def draw_page_number(canv, number):
+    canv.saveState()
+    canv.setFont('Helvetica', 9)
+    canv.drawCentredString(letter[0] / 2, 0.5 * inch, str(number))
+    canv.restoreState()
+
+class ManualDocTemplate(SimpleDocTemplate):
+    # Records each section heading with the page it lands on, and bookmarks it
+    # in the PDF outline when the document is rendered in one piece
+    def __init__(self, filename, add_outline=True):
+        super().__init__(filename, pagesize=letter)
+        self.add_outline = add_outline
+        self.headings = []
+
+    def afterFlowable(self, flowable):
+        if not isinstance(flowable, Paragraph) or flowable.style.name not in OUTLINE_LEVELS:
+            return
+
+        # The outline can only nest one level at a time
+        previous_level = self.headings[-1][0] if self.headings else -1
+        level = min(OUTLINE_LEVELS[flowable.style.name], previous_level + 1)
+        title = flowable.getPlainText()
+        self.headings.append((level, title, self.page))
+
+        if self.add_outline:
+            key = f"heading_{len(self.headings)}"
+            self.canv.bookmarkPage(key)
+            self.canv.addOutlineEntry(title, key, level)
+
+def image_flowables(image_path, styles, image_dimensions):
+    if not os.path.exists(image_path):
+        print(f"Image file not found: {image_path}")
+        return [Paragraph(f"[Missing Image: {escape(os.path.basename(image_path))}]", styles['BodyText']),
+                Spacer(1, 12)]
+
+    try:
+        # Pixel sizes are recorded when images are stored, so an image is
+        # only opened here if its size is unknown, and then only once;
+        # reportlab embeds a given file as a single XObject
+        if image_path not in image_dimensions:
+            with PILImage.open(image_path) as img:
+                image_dimensions[image_path] = img.size
+            count("images_opened")
+        new_width, new_height = display_size(*image_dimensions[image_path])
+        return [Image(image_path, width=new_width, height=new_height), Spacer(1, 12)]
+    except Exception as e:
+        print(f"Error adding image {image_path}: {str(e)}")
+        # If there's an error, add a placeholder text
+        return [Paragraph(f"[Image: {escape(os.path.basename(image_path))}]", styles['BodyText']), Spacer(1, 12)]
+
+def markup(text):
+    # Extracted text is plain, reportlab parses it as markup
+    return escape(text).replace("\n", "<br/>")
+
+def table_flowable(rows, styles):
+    # Columns share the frame width; short rows are padded so the grid lines up
+    column_count = max(len(row) for row in rows)
+    data = [[Paragraph(markup(cell), styles['TableCell']) for cell in row] + [""] * (column_count - len(row))
+            for row in rows]
+    return Table(data, colWidths=[FRAME_WIDTH / column_count] * column_count, style=TABLE_STYLE)
+
+def block_flowables(block, styles, image_paths, image_dimensions):
+    kind = block[0]
+    if kind == "paragraph":
+        return [Paragraph(markup(block[1]), styles['BodyText']), Spacer(1, 12)]
+    if kind == "list":
+        _, ordered, items = block
+        items = [ListItem(Paragraph(markup(item), styles['ListItem'])) for item in items]
+        return [ListFlowable(items, bulletType='1' if ordered else 'bullet', leftIndent=18), Spacer(1, 12)]
+    if kind == "table":
+        return [table_flowable(block[1], styles), Spacer(1, 12)]
+    if kind == "note":
+        _, note_kind, text = block
+        style = styles['Warning'] if note_kind in WARNING_KINDS else styles['Note']
+        return [Paragraph(f"<b>{note_kind.upper()}:</b> {markup(text)}", style), Spacer(1, 12)]
+    if kind == "image":
+        return image_flowables(image_paths[block[1]], styles, image_dimensions)
+    print(f"Unknown block type: {kind}")
+    return []
+
+def section_flowables(section, styles, image_dimensions):
+    level, title, content, image_sources, blocks = section
+    flowables = []
+
+    heading_style = f'Heading{min(level + 1, 4)}'
+    # Titles are plain text, like the blocks
+    flowables.append(Paragraph(escape(title), styles[heading_style]))
+    flowables.append(Spacer(1, 12))
+
+    # One flowable per block, so a long topic is laid out as many short
+    # paragraphs instead of one that reportlab keeps re-splitting at page ends
+    for block in blocks:
+        flowables.extend(block_flowables(block, styles, image_sources, image_dimensions))
+
+    return flowables
+
+def create_pdf(sections, image_dimensions=None, output_pdf=OUTPUT_PDF, title=MANUAL_TITLE):
+    doc = ManualDocTemplate(output_pdf)
+    styles = build_styles()
+
+    image_dimensions = dict(image_dimensions or {})
+    section_count = 0
+
+    def chapters():
+        # Flowables are built and laid out one chapter at a time instead of
+        # collecting the whole manual before doc.build
+        nonlocal section_count
+        flowables = title_flowables(styles, title)
+
+        for section in sections:
+            if section[0] == 1 and flowables:
+                yield flowables
+                flowables = []
+            with span("section_flowables"):
+                flowables.extend(section_flowables(section, styles, image_dimensions))
+            section_count += 1
+        yield flowables
+
+    def on_page(canv, doc):
+        draw_page_number(canv, doc.page)
+
+    try:
+        # Layout and writing happen together in doc.build, so this span also
+        # covers the section_flowables spans of the streamed chapters
+        with span("pdf_build"):
+            doc.build(FlowableStream(chapters()), onFirstPage=on_page, onLaterPages=on_page)
+        print(f"PDF created: {output_pdf} with {section_count} unique sections")
+    except Exception as e:
+        print(f"Error building PDF: {str(e)}")
+    return section_count
+
+def split_chapters(sections):
+    chapter = []
+    for section in sections:
+        if section[0] == 1 and chapter:
+            yield chapter
+            chapter = []
+        chapter.append(section)
+    if chapter:
+        yield chapter
+
+def chapter_key(index, chapter, title=MANUAL_TITLE):
+    # The first chapter also carries the title page. Images are named by
+    # content, so their names and sizes identify them wherever the bundle is,
+    # and manuals sharing a chapter share its rendered PDF
+    chapter_data = [(level, section_title, text, [os.path.basename(path) for path in image_paths], blocks)
+                    for level, section_title, text, image_paths, blocks in chapter]
+    digest = hashlib.sha256(json.dumps([RENDER_VERSION, index == 0 and title, chapter_data]).encode())
+    for section in chapter:
+        for image_path in section[3]:
+            if os.path.exists(image_path):
+                digest.update(f"{os.path.basename(image_path)}:{os.path.getsize(image_path)}".encode())
+    return digest.hexdigest()
+
+def render_chapter(index, chapter, pdf_path, image_dimensions, title=MANUAL_TITLE):
+    # Runs in a worker process. Page numbers and the outline are added when
+    # the chapters are merged, since only then are the page offsets known
+    start = time.perf_counter()
+    styles = build_styles()
+    flowables = title_flowables(styles, title) if index == 0 else []
+    for section in chapter:
+        flowables.extend(section_flowables(section, styles, image_dimensions))
+
+    tmp_path = f"{pdf_path}.tmp"
+    doc = ManualDocTemplate(tmp_path, add_outline=False)
+    doc.build(flowables)
+    os.replace(tmp_path, pdf_path)
+
+    meta = {"headings": doc.headings, "sections": len(chapter), "render_seconds": time.perf_counter() - start}
+    write_json(f"{pdf_path}.json", meta)
+    return meta
+
+def page_number_overlay(page_count):
+    from pypdf import PdfReader
+
+    buffer = BytesIO()
+    canv = canvas.Canvas(buffer, pagesize=letter)
+    for number in range(1, page_count + 1):
+        draw_page_number(canv, number)
+        canv.showPage()
+    canv.save()
+    return PdfReader(buffer)
+
+def merge_chapters(chapters, output_pdf=OUTPUT_PDF):
+    # pypdf is only needed for parallel rendering
+    from pypdf import PdfReader, PdfWriter
+
+    readers = [(PdfReader(pdf_path), meta) for pdf_path, meta in chapters]
+    number_pages = iter(page_number_overlay(sum(len(reader.pages) for reader, _ in readers)).pages)
+
+    writer = PdfWriter()
+    parents = []
+    for reader, meta in readers:
+        offset = len(writer.pages)
+
+        # Stamp the page number before the page is added, so the writer only
+        # ever sees the final page content
+        for page in reader.pages:
+            page.merge_page(next(number_pages))
+            writer.add_page(page).compress_content_streams()
+
+        for level, title, page in meta["headings"]:
+            del parents[level:]
+            parent = parents[-1] if parents else None
+            parents.append(writer.add_outline_item(title, offset + page - 1, parent=parent))
+
+    with open(output_pdf, 'wb') as f:
+        writer.write(f)
+    return len(writer.pages)
+
+def create_pdf_parallel(sections, jobs, image_dimensions=None, output_pdf=OUTPUT_PDF, title=MANUAL_TITLE):
+    image_dimensions = image_dimensions or {}
+    os.makedirs(CHAPTER_CACHE_DIR, exist_ok=True)
+
+    chapters = []
+    pending = set()
+    cached_count = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for index, chapter in enumerate(split_chapters(sections)):
+            pdf_path = os.path.join(CHAPTER_CACHE_DIR, f"{chapter_key(index, chapter, title)}.pdf")
+            meta = read_json(f"{pdf_path}.json")
+            if meta is not None and os.path.exists(pdf_path):
+                # Unchanged chapter, reuse the PDF rendered last time
+                chapters.append((pdf_path, meta))
+                cached_count += 1
+                count("chapters_reused")
+                continue
+
+            # Each worker only gets the sizes of its own chapter's images
+            chapter_dimensions = {path: image_dimensions[path] for section in chapter
+                                  for path in section[3] if path in image_dimensions}
+            future = pool.submit(render_chapter, index, chapter, pdf_path, chapter_dimensions, title)
+            chapters.append((pdf_path, future))
+            pending.add(future)
+
+            # Only keep a few chapters queued so the working set stays bounded
+            if len(pending) >= jobs * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    print(f"Rendered {len(chapters) - cached_count} chapter(s) with {jobs} processes, "
+          f"reused {cached_count} from {CHAPTER_CACHE_DIR}")
+
+    try:
+        rendered = []
+        for pdf_path, meta in chapters:
+            if not isinstance(meta, dict):
+                meta = meta.result()
+                # Timed in the worker process, which has no metrics of its own
+                add_time("render_chapter", meta["render_seconds"])
+                count("chapters_rendered")
+            rendered.append((pdf_path, meta))
+        chapters = rendered
+        section_count = sum(meta["sections"] for _, meta in chapters)
+        with span("merge_chapters"):
+            page_count = merge_chapters(chapters, output_pdf)
+        print(f"PDF created: {output_pdf} with {section_count} unique sections, {page_count} pages")
+    except Exception as e:
+        print(f"Error building PDF: {str(e)}")
+        return 0
+    return section_count
+
+class PdfSink:
+    # The PDF as one of the outputs of render_manual.render_bundle
+    name = "pdf"
+
+    def __init__(self, output_pdf, title, image_dimensions, render_jobs=1):
+        self.output_pdf = output_pdf
+        self.title = title
+        self.image_dimensions = image_dimensions
+        self.render_jobs = render_jobs
+
+    def render(self, sections):
+        if self.render_jobs > 1:
+            return create_pdf_parallel(sections, self.render_jobs, self.image_dimensions, self.output_pdf, self.title)
+        return create_pdf(sections, self.image_dimensions, self.output_pdf, self.title)
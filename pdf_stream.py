@@ -0,0 +1,16 @@
+class FlowableStream(list):
+    # doc.build() consumes its flowables from the front of the list and checks
+    # len() before each one. This list refills itself from an iterator of
+    # chunks (one chapter each) whenever it runs dry, so only the current
+    # chapter's flowables are alive while reportlab lays out the manual
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = iter(chunks)
+
+    def __len__(self):
+        while not list.__len__(self):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.extend(chunk)
+        return list.__len__(self)
@@ -0,0 +1,189 @@
+from urllib.parse import urlsplit
+
+from playwright.async_api import async_playwright
+
+from browser_service import service_endpoint
+from image_capture import ImageCapture
+from metrics import count, span
+from readiness import load_topic
+from scheduler import AdaptiveLimiter, run_with_retries
+from settings import DEFAULT_CONCURRENCY
+from topic_extract import body_blocks
+
+# Only what extraction needs is loaded: images from anywhere, and from the
+# manual's own origin its documents (the manual page and topic HTML), the
+# requests they make, and its scripts, which define newSrc and the navigation.
+# Stylesheets, fonts, media, third-party scripts such as jQuery from
+# ajax.googleapis.com, and third-party frames and beacons are aborted
+BLOCK_RESOURCES = True
+ALLOWED_RESOURCE_TYPES = {"image"}
+SAME_ORIGIN_RESOURCE_TYPES = {"document", "xhr", "fetch", "other", "script"}
+
+# How long to wait for the browser service before launching a browser instead
+ATTACH_TIMEOUT_MS = 5000
+
+async def get_page_content(page):
+    await page.wait_for_selector("#ohb_topic")
+
+    content = await page.evaluate("""
+        () => {
+            const obj = document.querySelector('#ohb_topic');
+            if (obj && obj.contentDocument) {
+                const body = obj.contentDocument.body;
+
+                // Exclude the header elements
+                const headerElements = body.querySelectorAll('h1, h2, h3, h4, h5, h6');
+                headerElements.forEach(el => el.remove());
+
+                // Get the remaining text content
+                const textContent = body.innerText;
+
+                // The HTML is split into blocks on the Python side, the
+                // same way the HTTP backend does
+                const bodyHTML = body.innerHTML;
+
+                // Get the images
+                const objectImages = body.querySelectorAll('object[type="image/png"][data]');
+                // Only the resolved URLs are returned, the original bytes are
+                // taken from the network responses on the Python side
+                const imageSources = Array.from(objectImages).map((img, idx) => {
+                    const data = img.getAttribute('data');
+                    const url = new URL(data, obj.contentDocument.baseURI).href;
+                    return {url, filename: `image_${idx}.png`};
+                });
+
+                return { textContent, bodyHTML, imageSources };
+            }
+            return { textContent: '', bodyHTML: '', imageSources: [] };
+        }
+    """)
+
+    return content
+
+class PlaywrightWorker:
+    def __init__(self, page, limiter):
+        self.image_capture = ImageCapture(page)
+        self.limiter = limiter
+
+    async def fetch_topic(self, topic):
+        # The page loads a topic's images along with it, so a whole topic
+        # load takes one limiter slot and is retried as one
+        return await run_with_retries(self.limiter, lambda: self.load_topic(topic), topic.title)
+
+    async def load_topic(self, topic):
+        page = self.image_capture.page
+
+        # Load the topic document into #ohb_topic by URL, the same way a nav
+        # click does, and wait until it and its images are ready
+        self.image_capture.clear()
+        with span("navigate"):
+            await load_topic(page, topic.url)
+
+        with span("get_page_content"):
+            content = await get_page_content(page)
+
+        images = []
+        for image_source in content['imageSources']:
+            # Original image bytes as served, no canvas re-encode or base64 round trip
+            with span("image_transfer"):
+                data, how = await self.image_capture.fetch(image_source['url'])
+            count("bytes_transferred", len(data))
+            count(f"images_{how}")
+            images.append({"filename": image_source['filename'], "data": data, "how": how, "url": image_source['url']})
+
+        with span("extract_blocks"):
+            blocks = body_blocks(content['bodyHTML'], len(images))
+
+        # The browser does not expose the topic document's response headers,
+        # so update runs always re-check these topics
+        return content['textContent'], images, {}, blocks
+
+class PlaywrightBrowser:
+    # The browser and context the backend opens its pages in: the warm
+    # browser service if one is running, otherwise a browser of its own.
+    # Manuals crawled together share one
+    async def attach(self, endpoint):
+        # The service's default context is the one with the persistent profile
+        # and disk cache, so pages are opened there rather than in a new one
+        try:
+            with span("browser_attach"):
+                self.browser = await self.playwright.chromium.connect_over_cdp(endpoint, timeout=ATTACH_TIMEOUT_MS)
+            print(f"Attached to the browser service at {endpoint}")
+            return self.browser.contexts[0]
+        except Exception as e:
+            print(f"Could not attach to the browser service at {endpoint}, launching a browser: {str(e)}")
+            count("browser_attach_errors")
+            return None
+
+    async def __aenter__(self):
+        self.playwright = await async_playwright().start()
+        endpoint = service_endpoint()
+        self.context = await self.attach(endpoint) if endpoint else None
+        self.attached = self.context is not None
+        if not self.attached:
+            with span("browser_launch"):
+                self.browser = await self.playwright.chromium.launch(headless=True)
+                self.context = await self.browser.new_context()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # The service's browser keeps running, this only disconnects from it
+        if not self.attached:
+            await self.browser.close()
+        await self.playwright.stop()
+
+class PlaywrightBackend:
+    # Renders every topic in headless Chromium. Slower than the HTTP backend
+    # but sees exactly what a reader sees, so it is kept as the fallback
+    name = "playwright"
+
+    def __init__(self, url, browser=None, limiter=None):
+        self.url = url
+        self.origin = urlsplit(url).netloc
+        self.browser = browser
+        self.owns_browser = browser is None
+        self.limiter = limiter or AdaptiveLimiter(DEFAULT_CONCURRENCY, DEFAULT_CONCURRENCY)
+
+    async def route_request(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        if resource_type in ALLOWED_RESOURCE_TYPES or (
+                resource_type in SAME_ORIGIN_RESOURCE_TYPES and urlsplit(request.url).netloc == self.origin):
+            await route.continue_()
+            return
+        count(f"blocked_{resource_type}")
+        await route.abort()
+
+    async def open_page(self):
+        # Routes are set per page, since the context may be shared with
+        # other manuals and the browser service
+        page = await self.browser.context.new_page()
+        if BLOCK_RESOURCES:
+            await page.route("**/*", self.route_request)
+        await page.goto(self.url)
+        await page.wait_for_selector("#navigation_bar")
+        self.pages.append(page)
+        return page
+
+    async def __aenter__(self):
+        if self.owns_browser:
+            self.browser = await PlaywrightBrowser().__aenter__()
+        self.pages = []
+        await self.open_page()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Only what this backend opened is closed
+        for page in self.pages:
+            await page.close()
+        if self.owns_browser:
+            await self.browser.__aexit__(*exc_info)
+
+    async def fetch_manifest_html(self):
+        return await self.pages[0].content()
+
+    async def open_workers(self, count):
+        # One page per worker, all sharing the same browser context
+        for _ in range(count - 1):
+            await self.open_page()
+        return [PlaywrightWorker(page, self.limiter) for page in self.pages]
@@ -0,0 +1,60 @@
+# How long to wait for a topic document and its images before giving up
+READY_TIMEOUT_SECONDS = 30
+
+# Points #ohb_topic at a new document and resolves once the <object> fires its
+# load event, instead of sleeping and hoping the document has arrived
+LOAD_TOPIC_SCRIPT = """
+    ([url, timeoutMs]) => new Promise((resolve, reject) => {
+        const obj = document.querySelector('#ohb_topic');
+        if (!obj) {
+            reject(new Error('#ohb_topic not found'));
+            return;
+        }
+
+        const timer = setTimeout(() => reject(new Error(`Timed out loading ${url}`)), timeoutMs);
+        obj.addEventListener('load', () => {
+            clearTimeout(timer);
+            resolve(true);
+        }, { once: true });
+        obj.addEventListener('error', () => {
+            clearTimeout(timer);
+            reject(new Error(`Failed to load ${url}`));
+        }, { once: true });
+
+        newSrc(url, newSrcEnum.OTHER);
+    })
+"""
+
+# Resolves once every <img> and image <object> in the topic has decoded, so the
+# extractor never reads a 0x0 image. Broken images resolve too, they are
+# reported by the extractor rather than blocking the topic
+WAIT_FOR_IMAGES_SCRIPT = """
+    (timeoutMs) => {
+        const obj = document.querySelector('#ohb_topic');
+        const doc = obj && obj.contentDocument;
+        if (!doc || !doc.body) {
+            return false;
+        }
+
+        const decodes = [];
+        for (const img of doc.body.querySelectorAll('img')) {
+            decodes.push(img.decode().catch(() => null));
+        }
+        for (const imgObject of doc.body.querySelectorAll('object[type="image/png"]')) {
+            const image = new Image();
+            image.src = new URL(imgObject.getAttribute('data'), doc.baseURI).href;
+            decodes.push(image.decode().catch(() => null));
+        }
+
+        const timeout = new Promise((resolve) => setTimeout(() => resolve(false), timeoutMs));
+        return Promise.race([Promise.all(decodes).then(() => true), timeout]);
+    }
+"""
+
+
+async def load_topic(page, url, timeout=READY_TIMEOUT_SECONDS):
+    await page.evaluate(LOAD_TOPIC_SCRIPT, [url, timeout * 1000])
+
+    images_ready = await page.evaluate(WAIT_FOR_IMAGES_SCRIPT, timeout * 1000)
+    if not images_ready:
+        print(f"Images not ready after {timeout}s: {url}")
@@ -0,0 +1,84 @@
+import argparse
+
+from dedupe import dedupe_sections
+from metrics import metrics, profile, profiled_phases, span
+from section_bundle import SectionBundle
+from manuals import add_manual_argument, manual_outputs, selected_manuals
+from settings import (BUNDLE_DIR, DEDUPE_LOG, DEDUPE_THRESHOLD, DEFAULT_FORMATS, DEFAULT_LOCALE, OUTPUT_EPUB,
+                      OUTPUT_FORMATS, OUTPUT_PDF, SITE_DIR)
+
+# Builds the PDF, and the HTML site and EPUB if asked for, from a bundle
+# written by download-manual.py, without crawling anything. Needs reportlab
+# and Pillow (and pypdf for --render-jobs), but no browser, so styling
+# changes can be tried in seconds on any machine
+
+
+def open_sinks(outputs, title, image_dimensions, render_jobs, language):
+    # reportlab takes longer to import than most commands take to run, so it
+    # is only loaded once there is a PDF to render
+    sinks = []
+    if "pdf" in outputs:
+        from pdf_render import PdfSink
+        sinks.append(PdfSink(outputs["pdf"], title, image_dimensions, render_jobs))
+    if "html" in outputs:
+        from html_site import HtmlSiteSink
+        sinks.append(HtmlSiteSink(outputs["html"], title, image_dimensions))
+    if "epub" in outputs:
+        from epub_render import EpubSink
+        sinks.append(EpubSink(outputs["epub"], title, image_dimensions, language))
+    return sinks
+
+
+def render_bundle(bundle_dir=BUNDLE_DIR, render_jobs=1, dedupe_threshold=DEDUPE_THRESHOLD, outputs=None,
+                  language=DEFAULT_LOCALE, dedupe_log=DEDUPE_LOG):
+    # outputs maps each format to write to its path, {"pdf": OUTPUT_PDF} by
+    # default. The bundle is read and deduplicated once for all of them;
+    # returns the number of sections each format got
+    from fan_out import fan_out
+
+    outputs = outputs or {"pdf": OUTPUT_PDF}
+    bundle = SectionBundle(bundle_dir)
+    print(f"Rendering {len(bundle)} sections from {bundle_dir}/ as {', '.join(outputs)}")
+
+    sections = iter(bundle)
+    if dedupe_threshold is not None:
+        sections = dedupe_sections(sections, dedupe_threshold, dedupe_log)
+
+    sinks = open_sinks(outputs, bundle.title, bundle.image_dimensions(), render_jobs, language)
+    with profile("render"), span("render"):
+        return fan_out(sections, sinks)
+
+
+def render_main(args):
+    profiled_phases.update(args.profile)
+    for manual in selected_manuals(args):
+        render_bundle(manual.bundle_dir, args.render_jobs, None if args.no_dedupe else args.dedupe_threshold,
+                      manual_outputs(manual, args.format or DEFAULT_FORMATS), manual.locale, manual.dedupe_log)
+    metrics.report()
+    print(f"Metrics written to {metrics.write()}")
+    return 0
+
+
+def add_render_arguments(parser):
+    add_manual_argument(parser)
+    parser.add_argument("--bundle", help=f"bundle directory (default: {BUNDLE_DIR}, or one per manual)")
+    parser.add_argument("--format", action="append", choices=OUTPUT_FORMATS,
+                        help="output to write, repeat it for several: all are written in one pass over the bundle "
+                             f"(default: {', '.join(DEFAULT_FORMATS)})")
+    parser.add_argument("--output", help=f"PDF to write (default: {OUTPUT_PDF}, or one per manual)")
+    parser.add_argument("--epub", help=f"EPUB to write (default: {OUTPUT_EPUB}, or one per manual)")
+    parser.add_argument("--site", help=f"directory of the HTML site (default: {SITE_DIR}, or one per manual)")
+    parser.add_argument("--render-jobs", type=int, default=1,
+                        help="render chapters in this many processes and merge them (requires pypdf)")
+    parser.add_argument("--dedupe-threshold", type=float, default=DEDUPE_THRESHOLD,
+                        help="similarity from which a section counts as a duplicate of an earlier one, "
+                             f"1 for exact duplicates only (default: {DEDUPE_THRESHOLD})")
+    parser.add_argument("--no-dedupe", action="store_true", help="render every section, even duplicates")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the Fisker Ocean manual PDF from a crawled bundle")
+    add_render_arguments(parser)
+    parser.add_argument("--profile", action="append", choices=["render"], default=[],
+                        help="run the render under cProfile and save the stats next to the metrics")
+    raise SystemExit(render_main(parser.parse_args()))
@@ -0,0 +1,108 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+
+from metrics import count
+
+# Retries of a failed topic, with full-jitter exponential backoff between them
+RETRY_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+
+# Client errors that will not go away by asking again
+PERMANENT_STATUSES = {400, 401, 403, 404, 410}
+
+# AIMD: the limit grows by about one slot per window of successful requests
+# and is cut by DECREASE_FACTOR when a request fails, at most once per round
+# trip. Latency alone only cuts it once the smoothed latency has stayed above
+# LATENCY_TOLERANCE times the best seen, and LATENCY_MIN_GAP_SECONDS above
+# it, for LATENCY_HIGH_SAMPLES requests in a row: jitter over a fast server's
+# best case is not the server struggling
+DECREASE_FACTOR = 0.5
+LATENCY_TOLERANCE = 2.0
+LATENCY_MIN_GAP_SECONDS = 0.25
+LATENCY_HIGH_SAMPLES = 8
+LATENCY_SMOOTHING = 0.2
+# The best latency seen creeps up slowly so one lucky response does not pin it
+BASELINE_DRIFT = 1.01
+
+
+def is_retryable(error):
+    # aiohttp and Playwright errors alike; only a few HTTP statuses are final
+    return getattr(error, "status", None) not in PERMANENT_STATUSES
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+class AdaptiveLimiter:
+    # Caps the requests in flight, adjusting the cap to how the server copes
+    def __init__(self, initial, maximum, minimum=1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.changed = asyncio.Condition()
+        self.latency = None
+        self.baseline = None
+        self.slow_samples = 0
+        self.last_decrease = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(time.perf_counter() - start, ok)
+            async with self.changed:
+                self.in_flight -= 1
+                self.changed.notify_all()
+
+    def record(self, latency, ok):
+        previous = int(self.limit)
+        if ok:
+            self.latency = latency if self.latency is None else (
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency)
+            self.baseline = self.latency if self.baseline is None else min(self.latency, self.baseline * BASELINE_DRIFT)
+            slow = (self.latency > self.baseline * LATENCY_TOLERANCE
+                    and self.latency - self.baseline > LATENCY_MIN_GAP_SECONDS)
+            self.slow_samples = self.slow_samples + 1 if slow else 0
+
+        if not ok or self.slow_samples >= LATENCY_HIGH_SAMPLES:
+            # Many requests fail or slow down together; one cut per round trip
+            now = time.perf_counter()
+            if now - self.last_decrease > (self.latency or 0):
+                self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+                self.last_decrease = now
+                self.slow_samples = 0
+                count("concurrency_decreases")
+        elif not self.slow_samples:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+        if int(self.limit) != previous:
+            print(f"Concurrency limit now {int(self.limit)} (latency {self.latency or 0:.2f}s)")
+
+
+async def run_with_retries(limiter, call, description, attempts=RETRY_ATTEMPTS):
+    # Runs call() in a limiter slot, retrying with backoff; the last error is
+    # raised once the attempts are used up
+    for attempt in range(attempts):
+        try:
+            async with limiter.slot():
+                return await call()
+        except Exception as e:
+            if attempt + 1 == attempts or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Retrying {description} in {delay:.1f}s (attempt {attempt + 2}/{attempts}): {str(e)}")
+            count("retries")
+            await asyncio.sleep(delay)
@@ -0,0 +1,232 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import time
+from collections import defaultdict
+
+from settings import SEARCH_INDEX
+
+# Offline replacement for the manual's remote search: a positional inverted
+# index built while the crawler saves topics, written as one binary file that
+# is searched through mmap without loading it
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+DEFAULT_LIMIT = 10
+
+# File layout, all integers little-endian:
+#   header   magic, version, document count, term count, average document
+#            length, and the offsets of the four sections below
+#   docs     per document: length in tokens, offset and length of its
+#            {"url", "title"} JSON in the strings section
+#   terms    per term, sorted by term: offset and length of the term in the
+#            strings section, document frequency, offset of its postings
+#   strings  UTF-8 terms and document JSON
+#   postings per term and document: document id, term frequency, positions
+INDEX_MAGIC = b"FMSIDX\x00\x00"
+INDEX_VERSION = 1
+HEADER = struct.Struct("<8sIIIdQQQQ")
+DOC_RECORD = struct.Struct("<III")
+TERM_RECORD = struct.Struct("<IIIQ")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndexBuilder:
+    # Topics are added one at a time as the crawler finishes them, so the
+    # index costs no extra pass over the manual
+    def __init__(self):
+        self.docs = []
+        self.postings = defaultdict(list)
+
+    def add(self, url, title, text):
+        doc_id = len(self.docs)
+        tokens = tokenize(title) + tokenize(text)
+        positions = defaultdict(list)
+        for position, token in enumerate(tokens):
+            positions[token].append(position)
+        for token, token_positions in positions.items():
+            self.postings[token].append((doc_id, token_positions))
+        self.docs.append((len(tokens), {"url": url, "title": title}))
+
+    def write(self, path=SEARCH_INDEX):
+        strings = bytearray()
+        doc_records = bytearray()
+        for length, meta in self.docs:
+            data = json.dumps(meta, ensure_ascii=False).encode()
+            doc_records += DOC_RECORD.pack(length, len(strings), len(data))
+            strings += data
+
+        terms = sorted(self.postings)
+        term_records = bytearray()
+        postings = bytearray()
+        for term in terms:
+            data = term.encode()
+            term_records += TERM_RECORD.pack(len(strings), len(data), len(self.postings[term]), len(postings))
+            strings += data
+            for doc_id, positions in self.postings[term]:
+                postings += struct.pack(f"<II{len(positions)}I", doc_id, len(positions), *positions)
+
+        total_length = sum(length for length, _ in self.docs)
+        average_length = total_length / len(self.docs) if self.docs else 0.0
+        docs_offset = HEADER.size
+        terms_offset = docs_offset + len(doc_records)
+        strings_offset = terms_offset + len(term_records)
+        postings_offset = strings_offset + len(strings)
+        header = HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(self.docs), len(terms), average_length,
+                             docs_offset, terms_offset, strings_offset, postings_offset)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for part in (header, doc_records, term_records, strings, postings):
+                f.write(part)
+        os.replace(tmp_path, path)
+        return path
+
+
+class SearchIndex:
+    def __init__(self, path=SEARCH_INDEX):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.doc_count, self.term_count, self.average_length,
+         self.docs_offset, self.terms_offset, self.strings_offset, self.postings_offset) = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a search index this version can read")
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.data[start:start + length]
+
+    def document(self, doc_id):
+        length, meta_offset, meta_length = DOC_RECORD.unpack_from(self.data, self.docs_offset + doc_id * DOC_RECORD.size)
+        return length, json.loads(self.string(meta_offset, meta_length))
+
+    def find_term(self, term):
+        # Binary search over the sorted term records
+        key = term.encode()
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            term_offset, term_length, doc_freq, postings = TERM_RECORD.unpack_from(
+                self.data, self.terms_offset + middle * TERM_RECORD.size)
+            found = self.string(term_offset, term_length)
+            if found == key:
+                return doc_freq, postings
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def postings(self, term):
+        # {doc id: positions} for a term, read straight from the mapped file
+        found = self.find_term(term)
+        if found is None:
+            return {}
+
+        doc_freq, offset = found
+        offset += self.postings_offset
+        result = {}
+        for _ in range(doc_freq):
+            doc_id, term_freq = struct.unpack_from("<II", self.data, offset)
+            result[doc_id] = struct.unpack_from(f"<{term_freq}I", self.data, offset + 8)
+            offset += 8 + term_freq * 4
+        return result
+
+    def phrase_docs(self, words):
+        # Documents where the words appear next to each other, in order
+        term_postings = [self.postings(word) for word in words]
+        docs = set(term_postings[0])
+        for postings in term_postings[1:]:
+            docs &= set(postings)
+
+        matches = set()
+        for doc_id in docs:
+            starts = set(term_postings[0][doc_id])
+            for shift, postings in enumerate(term_postings[1:], 1):
+                starts &= {position - shift for position in postings[doc_id]}
+            if starts:
+                matches.add(doc_id)
+        return matches
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        # Plain words are ranked with BM25; "quoted phrases" must also appear
+        # verbatim in every result
+        phrases = [tokenize(phrase) for phrase in PHRASE_PATTERN.findall(query)]
+        terms = tokenize(PHRASE_PATTERN.sub(" ", query)) + [word for phrase in phrases for word in phrase]
+
+        allowed = None
+        for phrase in phrases:
+            if len(phrase) > 1:
+                docs = self.phrase_docs(phrase)
+                allowed = docs if allowed is None else allowed & docs
+
+        scores = defaultdict(float)
+        lengths = {}
+        for term in set(terms):
+            postings = self.postings(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (self.doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, positions in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                if doc_id not in lengths:
+                    lengths[doc_id] = self.document(doc_id)[0]
+                term_freq = len(positions)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / (self.average_length or 1))
+                scores[doc_id] += idf * term_freq * (BM25_K1 + 1) / (term_freq + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(score, self.document(doc_id)[1]) for doc_id, score in ranked]
+
+
+def search_main(args):
+    if not os.path.exists(args.index):
+        print(f"No search index at {args.index}, run download-manual.py first")
+        return 1
+
+    with SearchIndex(args.index) as index:
+        start = time.perf_counter()
+        results = index.search(args.query, args.limit)
+        elapsed = time.perf_counter() - start
+
+        for score, doc in results:
+            print(f"{score:7.3f}  {doc['title']}  ({doc['url']})")
+        print(f"{len(results)} result(s) from {index.doc_count} topics in {elapsed * 1000:.2f} ms")
+    return 0
+
+
+def add_search_arguments(parser):
+    parser.add_argument("query", help='words to look for; put phrases in "double quotes"')
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help=f"results to show (default: {DEFAULT_LIMIT})")
+    parser.add_argument("--index", default=SEARCH_INDEX, help=f"index file (default: {SEARCH_INDEX})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the downloaded manual offline")
+    add_search_arguments(parser)
+    raise SystemExit(search_main(parser.parse_args()))
@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+
+from blocks import keep_images, text_blocks
+from image_store import stored_dimensions
+from manuals import MANUAL_TITLE
+from settings import BUNDLE_DIR
+
+# The hand-off between crawling and rendering: everything the renderer needs,
+# in a directory that can be copied to a machine without a browser
+#   sections.jsonl  one section per line, in manual order
+#   index.json      byte offset and length of each topic's line, by topic URL,
+#                   and the pixel size of each blob
+#   blobs/          images, named by the hash of the original bytes
+BUNDLE_VERSION = 1
+
+SECTIONS_FILE = "sections.jsonl"
+INDEX_FILE = "index.json"
+BLOB_DIR = "blobs"
+
+
+def add_blob(bundle_dir, image_path):
+    # Images are already content-addressed, so an existing blob is the same
+    # image. Hard links avoid a second copy when both are on one disk
+    blob_path = os.path.join(bundle_dir, BLOB_DIR, os.path.basename(image_path))
+    if not os.path.exists(blob_path):
+        try:
+            os.link(image_path, blob_path)
+        except OSError:
+            shutil.copyfile(image_path, blob_path)
+    return os.path.basename(blob_path)
+
+
+def write_bundle(bundle_dir, root_url, topic_sections, manual_title=None):
+    # topic_sections is the crawler's stream of (topic, section) pairs in
+    # manual order, sections being (level, title, text, image paths, blocks)
+    os.makedirs(os.path.join(bundle_dir, BLOB_DIR), exist_ok=True)
+    sections_path = os.path.join(bundle_dir, SECTIONS_FILE)
+
+    topics = {}
+    images = {}
+    loaded_dimensions = {}
+    section_count = 0
+    with open(f"{sections_path}.tmp", 'wb') as f:
+        for topic, (level, title, text, image_sources, blocks) in topic_sections:
+            blobs = []
+            kept = []
+            for index, path in enumerate(image_sources):
+                if os.path.exists(path):
+                    blobs.append(add_blob(bundle_dir, path))
+                    kept.append(index)
+                    images[blobs[-1]] = stored_dimensions(path, loaded_dimensions)
+
+            line = json.dumps({
+                "url": topic.url or None,
+                "level": level,
+                "title": title,
+                "text": text,
+                "images": blobs,
+                "blocks": keep_images(blocks, kept),
+            }, ensure_ascii=False).encode() + b"\n"
+            if topic.url:
+                topics[topic.url] = [f.tell(), len(line)]
+            f.write(line)
+            section_count += 1
+    os.replace(f"{sections_path}.tmp", sections_path)
+
+    index_path = os.path.join(bundle_dir, INDEX_FILE)
+    with open(f"{index_path}.tmp", 'w', encoding="utf-8") as f:
+        json.dump({"version": BUNDLE_VERSION, "root_url": root_url, "title": manual_title, "sections": section_count,
+                   "topics": topics, "images": images}, f)
+    os.replace(f"{index_path}.tmp", index_path)
+    return section_count
+
+
+class SectionBundle:
+    def __init__(self, bundle_dir=BUNDLE_DIR):
+        self.bundle_dir = bundle_dir
+        with open(os.path.join(bundle_dir, INDEX_FILE), encoding="utf-8") as f:
+            self.index = json.load(f)
+        if self.index.get("version") != BUNDLE_VERSION:
+            raise ValueError(f"{bundle_dir} was written by a different version, crawl again")
+
+    def section(self, data):
+        images = [os.path.join(self.bundle_dir, BLOB_DIR, name) for name in data["images"]]
+        # Bundles written before topics were split into blocks get plain paragraphs
+        blocks = data.get("blocks") or text_blocks(data["text"], len(images))
+        return (data["level"], data["title"], data["text"], images, blocks)
+
+    @property
+    def title(self):
+        return self.index.get("title") or MANUAL_TITLE
+
+    def image_dimensions(self):
+        # {blob path: (width, height)}, so the renderer never opens an image
+        return {os.path.join(self.bundle_dir, BLOB_DIR, name): tuple(size)
+                for name, size in self.index.get("images", {}).items()}
+
+    def __len__(self):
+        return self.index["sections"]
+
+    def __iter__(self):
+        # Streams the sections in manual order, one line at a time
+        with open(os.path.join(self.bundle_dir, SECTIONS_FILE), 'rb') as f:
+            for line in f:
+                yield self.section(json.loads(line))
+
+    def get(self, url):
+        # Random access to one topic through the offset index
+        if url not in self.index["topics"]:
+            return None
+        offset, length = self.index["topics"][url]
+        with open(os.path.join(self.bundle_dir, SECTIONS_FILE), 'rb') as f:
+            f.seek(offset)
+            return self.section(json.loads(f.read(length)))
@@ -0,0 +1,61 @@
+import os
+
+# Defaults shared by the command line and the modules behind it. Nothing here
+# imports anything heavy, so download-manual.py can build its help and parse
+# its arguments before deciding which modules a command actually needs
+
+# Every manual lives under the same path on the site, by model and locale
+MANUAL_URL_TEMPLATE = "https://www.fiskerinc.com/owners_manual/{model}/content/{locale}/owner_guide.html"
+DEFAULT_MODEL = "Ocean"
+DEFAULT_LOCALE = "en-us"
+
+CACHE_DIR = "crawl_cache"
+IMAGE_DIR = "images"
+
+# The hand-off between crawling and rendering, see section_bundle.py
+BUNDLE_DIR = "manual_bundle"
+
+OUTPUT_PDF = "fisker_ocean_manual.pdf"
+OUTPUT_EPUB = "fisker_ocean_manual.epub"
+# Static HTML copy of the manual with an offline search page
+SITE_DIR = "manual_site"
+
+# Formats a render can write, all from one pass over the bundle
+OUTPUT_FORMATS = ("pdf", "html", "epub")
+DEFAULT_FORMATS = ("pdf",)
+
+SEARCH_INDEX = os.path.join(CACHE_DIR, "search_index.bin")
+
+# Every decision of the last render, one JSON object per line
+DEDUPE_LOG = os.path.join(CACHE_DIR, "dedupe_log.jsonl")
+
+# Most topic and image requests in flight at the same time
+DEFAULT_CONCURRENCY = 4
+
+# "http" fetches topics directly and falls back to "playwright" for anything
+# it could not fetch; "playwright" always uses the browser
+DEFAULT_BACKEND = "http"
+
+# DevTools port of the warm browser kept by `download-manual.py browser start`
+BROWSER_SERVICE_PORT = 9222
+
+# Sections whose text is at least this similar (estimated Jaccard similarity
+# of their word shingles) to an earlier section are rendered as a reference
+# to it instead of a second copy. 1.0 only drops exact duplicates
+DEDUPE_THRESHOLD = 0.9
+
+JPEG_QUALITY = 75
+
+# Images are never drawn larger than this many points in the PDF, so at ingest
+# they are scaled down to this box at the profile's resolution and never
+# carry more pixels than the output can show
+MAX_IMAGE_SIZE = (400, 500)
+IMAGE_PROFILES = {
+    "screen": {"dpi": 96, "quality": 70},
+    "ebook": {"dpi": 150, "quality": JPEG_QUALITY},
+    "print": {"dpi": 300, "quality": 90},
+}
+DEFAULT_IMAGE_PROFILE = "ebook"
+
+# Phases that can be run under cProfile with --profile
+PROFILE_PHASES = ("crawl", "render")
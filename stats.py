@@ -0,0 +1,109 @@
+import json
+import os
+
+from metrics import METRICS_DIR
+from search_index import SearchIndex
+from manuals import add_manual_argument, selected_manuals
+from section_bundle import INDEX_FILE
+from settings import BUNDLE_DIR, CACHE_DIR, IMAGE_DIR
+
+# What is on disk from earlier runs: the crawl cache, stored images, the
+# bundle, the search index, the outputs and the last run's metrics. Only reads
+# files, so it loads nothing the crawler or renderer needs
+
+
+def directory_size(path):
+    files, size = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def print_directory(label, path):
+    if not os.path.isdir(path):
+        print(f"{label:<14} none ({path}/ does not exist)")
+        return
+    files, size = directory_size(path)
+    print(f"{label:<14} {files} file(s), {format_size(size)} in {path}/")
+
+
+def print_images(image_dir):
+    if not os.path.isdir(image_dir):
+        print(f"{'Images':<14} none ({image_dir}/ does not exist)")
+        return
+    # One directory per image profile
+    for profile in sorted(os.listdir(image_dir)):
+        files, size = directory_size(os.path.join(image_dir, profile))
+        print(f"{'Images':<14} {files} file(s), {format_size(size)} in {image_dir}/{profile}/")
+
+
+def print_bundle(bundle_dir):
+    index_path = os.path.join(bundle_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        print(f"{'Bundle':<14} none ({index_path} does not exist)")
+        return
+    with open(index_path, encoding="utf-8") as f:
+        index = json.load(f)
+    _, size = directory_size(bundle_dir)
+    print(f"{'Bundle':<14} {index['sections']} sections, {len(index['topics'])} topics, "
+          f"{len(index.get('images', {}))} images, {format_size(size)} in {bundle_dir}/")
+
+
+def print_search_index(path):
+    if not os.path.exists(path):
+        print(f"{'Search index':<14} none ({path} does not exist)")
+        return
+    try:
+        with SearchIndex(path) as index:
+            print(f"{'Search index':<14} {index.doc_count} topics, {index.term_count} terms, "
+                  f"{format_size(os.path.getsize(path))} in {path}")
+    except Exception as e:
+        print(f"{'Search index':<14} unreadable: {str(e)}")
+
+
+def print_last_run(metrics_dir):
+    runs = sorted(name for name in os.listdir(metrics_dir)
+                  if name.startswith("run-") and name.endswith(".json")) if os.path.isdir(metrics_dir) else []
+    if not runs:
+        print(f"{'Last run':<14} none ({metrics_dir}/ has no metrics)")
+        return
+    with open(os.path.join(metrics_dir, runs[-1])) as f:
+        summary = json.load(f)
+    print(f"{'Last run':<14} {runs[-1]}, {summary['elapsed_seconds']:.1f}s")
+    for name, timing in summary["timings"].items():
+        print(f"  {name:<20} {timing['count']:>6}x {timing['total_seconds']:>9.3f}s total")
+    for name, value in summary["counters"].items():
+        print(f"  {name:<20} {value:>10}")
+
+
+def stats_main(args):
+    # The crawl cache, images and metrics are shared by every manual
+    print_directory("Cached topics", os.path.join(CACHE_DIR, "topics"))
+    print_images(IMAGE_DIR)
+    for manual in selected_manuals(args):
+        print(manual.title)
+        print_bundle(manual.bundle_dir)
+        print_search_index(manual.search_index)
+        for label, path in (("PDF", manual.output_pdf), ("EPUB", manual.output_epub)):
+            if os.path.exists(path):
+                print(f"{label:<14} {format_size(os.path.getsize(path))} in {path}")
+            else:
+                print(f"{label:<14} none ({path} does not exist)")
+        print_directory("HTML site", manual.site_dir)
+    print_last_run(METRICS_DIR)
+    return 0
+
+
+def add_stats_arguments(parser):
+    add_manual_argument(parser)
+    parser.add_argument("--bundle", help=f"bundle directory (default: {BUNDLE_DIR}, or one per manual)")
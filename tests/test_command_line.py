@@ -0,0 +1,46 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# download-manual.py is not an importable module name
+spec = importlib.util.spec_from_file_location("download_manual", os.path.join(REPO_DIR, "download-manual.py"))
+download_manual = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(download_manual)
+
+# Options can come before or after the command; a value given on either side
+# must reach the command, not be replaced by the command's default
+
+
+def parse(*argv):
+    return download_manual.parse_arguments(download_manual.build_parser(), list(argv))
+
+
+@pytest.mark.parametrize("argv", [("--concurrency", "9", "crawl"), ("crawl", "--concurrency", "9")])
+def test_crawl_options_on_either_side(argv):
+    assert parse(*argv).concurrency == 9
+
+
+@pytest.mark.parametrize("command", [("render",), ("stats",), ("search", "charging")])
+def test_manual_before_the_command(command):
+    args = parse("--manual", "Ocean/de-de", *command)
+    assert [manual.locale for manual in args.manual] == ["de-de"]
+
+
+def test_repeated_options_on_both_sides_are_combined():
+    args = parse("--manual", "Ocean/de-de", "--format", "epub", "render", "--manual", "Ocean/fr-fr",
+                 "--format", "html", "--render-jobs", "2")
+    assert [manual.locale for manual in args.manual] == ["de-de", "fr-fr"]
+    assert args.format == ["epub", "html"]
+    assert args.render_jobs == 2
+
+
+def test_defaults_without_options():
+    args = parse("render")
+    assert args.manual is None
+    assert args.render_jobs == 1
+    assert args.concurrency == download_manual.DEFAULT_CONCURRENCY
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import crawler  # noqa: E402
+import mock_server  # noqa: E402
+from section_bundle import SECTIONS_FILE  # noqa: E402
+
+# A concurrent crawl must produce the same manual as a serial one: the same
+# sections, in manifest order, with the same text and images
+TOPICS = 30
+
+
+def crawl_bundle(url, work_dir, concurrency):
+    work_dir.mkdir()
+    os.chdir(work_dir)
+    manifest = asyncio.run(crawler.retrieve_website_content(url, concurrency, refresh=True))
+    crawler.export_bundle(url, manifest)
+    with open(os.path.join(crawler.BUNDLE_DIR, SECTIONS_FILE), 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("error_rate", [0.0, 0.2])
+def test_serial_and_concurrent_crawls_match(tmp_path, monkeypatch, error_rate):
+    # The mock server reads menu.html relative to the repository
+    monkeypatch.chdir(REPO_DIR)
+    manual = mock_server.MockManual(topics=TOPICS, error_rate=error_rate)
+    server, url = mock_server.start_server(manual)
+    try:
+        serial = crawl_bundle(url, tmp_path / "serial", 1)
+        concurrent = crawl_bundle(url, tmp_path / "concurrent", 8)
+    finally:
+        server.shutdown()
+
+    assert serial.count(b"\n") > TOPICS // 2
+    assert serial == concurrent
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import crawl_cache  # noqa: E402
+import crawler  # noqa: E402
+import mock_server  # noqa: E402
+from incremental import check_for_updates  # noqa: E402
+
+# An update run checks every cached topic and image with a conditional
+# request. Errors the server recovers from must be retried, not taken as a
+# sign that the topic changed
+TOPICS = 30
+
+
+async def check(url, concurrency):
+    async with crawler.CrawlSession(concurrency) as session:
+        async with await session.open_backend("http", url) as http_backend:
+            previous_manifest = crawl_cache.load_manifest(crawler.CACHE_DIR, url)
+            return await check_for_updates(http_backend, url, previous_manifest, crawler.limit_manifest)
+
+
+def test_transient_errors_do_not_make_topics_stale(tmp_path, monkeypatch):
+    # The mock server reads menu.html relative to the repository
+    monkeypatch.chdir(REPO_DIR)
+    manual = mock_server.MockManual(topics=TOPICS)
+    server, url = mock_server.start_server(manual)
+    try:
+        monkeypatch.chdir(tmp_path)
+        asyncio.run(crawler.retrieve_website_content(url, 4, refresh=True))
+
+        manual.error_rate = 0.1
+        update_check = asyncio.run(check(url, 1))
+    finally:
+        server.shutdown()
+
+    assert manual.requests["error"] > 0
+    assert manual.requests["not_modified"] > TOPICS
+    assert update_check.stale == set()
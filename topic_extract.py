@@ -0,0 +1,205 @@
+import re
+from urllib.parse import urljoin
+
+import lxml.html
+
+from blocks import NOTE_KINDS
+
+# Turns a topic document into its text and blocks (see blocks.py). Both
+# backends use it, the browser backend on the HTML the page ended up with
+
+# Elements that start a new line in the browser's innerText
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "header", "hr", "li", "main", "nav", "ol",
+    "p", "pre", "section", "table", "tbody", "thead", "tfoot", "tr", "ul",
+}
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "object", "head"}
+
+
+def inner_text(element):
+    # Approximates body.innerText closely enough for the manual's simple
+    # markup: block elements start a new line (paragraphs leave a blank line),
+    # <br> breaks the line, table cells are separated by tabs, and whitespace
+    # inside a line is collapsed. Integers in parts are required line breaks;
+    # adjacent ones collapse to the largest, as they do in the browser
+    parts = []
+
+    def walk(el):
+        tag = el.tag if isinstance(el.tag, str) else ""
+        if tag in SKIPPED_TAGS:
+            return
+        if tag == "br":
+            parts.append("\n")
+        elif tag == "p":
+            parts.append(2)
+        elif tag in BLOCK_TAGS:
+            parts.append(1)
+        elif tag in ("td", "th"):
+            parts.append("\t")
+
+        if el.text and tag:
+            parts.append(re.sub(r"\s+", " ", el.text))
+        for child in el:
+            walk(child)
+            if child.tail:
+                parts.append(re.sub(r"\s+", " ", child.tail))
+
+        if tag == "p":
+            parts.append(2)
+        elif tag in BLOCK_TAGS:
+            parts.append(1)
+
+    walk(element)
+
+    text = []
+    line_breaks = 0
+    for part in parts:
+        if isinstance(part, int):
+            line_breaks = max(line_breaks, part)
+            continue
+        if line_breaks:
+            # Whitespace between blocks is not rendered
+            if not part.strip(" "):
+                continue
+            if text:
+                text.append("\n" * line_breaks)
+            line_breaks = 0
+        text.append(part)
+
+    return "\n".join(line.strip() for line in "".join(text).split("\n")).strip()
+
+
+LIST_TAGS = {"ul", "ol"}
+
+# Notes and warnings are marked either by a class on their container or by
+# a leading label, "WARNING" or "Note:"
+NOTE_CLASS = re.compile(r"\b(" + "|".join(NOTE_KINDS) + r")\b", re.IGNORECASE)
+NOTE_LABEL = re.compile(r"^(?:(" + "|".join(kind.upper() for kind in NOTE_KINDS) + r")\b|("
+                        + "|".join(kind.capitalize() for kind in NOTE_KINDS) + r"):)[:!.]?\s*")
+IMAGE_XPATH = './/object[@type="image/png"][@data]'
+
+
+def tag_of(element):
+    return element.tag if isinstance(element.tag, str) else ""
+
+
+def note_kind(element):
+    match = NOTE_CLASS.search(element.get("class") or "")
+    return match.group(1).lower() if match else None
+
+
+def has_blocks(element):
+    # Whether an element holds anything that is a block of its own
+    for descendant in element.iterdescendants():
+        tag = tag_of(descendant)
+        if tag in BLOCK_TAGS or tag == "object":
+            return True
+    return False
+
+
+def paragraph_block(text):
+    match = NOTE_LABEL.match(text)
+    if match:
+        rest = text[match.end():].strip()
+        return ["note", (match.group(1) or match.group(2)).lower(), rest or text]
+    return ["paragraph", text]
+
+
+def extract_blocks(body):
+    # Walks the body in document order. Block elements become blocks of
+    # their own, runs of inline content between them become paragraphs
+    blocks = []
+    run = []
+    image_count = [0]
+
+    def flush():
+        text = inner_text_of_run(run)
+        run.clear()
+        if text:
+            blocks.append(paragraph_block(text))
+
+    def add_image():
+        blocks.append(["image", image_count[0]])
+        image_count[0] += 1
+
+    def walk(element):
+        if element.text:
+            run.append(re.sub(r"\s+", " ", element.text))
+        for child in element:
+            tag = tag_of(child)
+            if tag == "object":
+                if child.get("type") == "image/png" and child.get("data"):
+                    flush()
+                    add_image()
+            elif tag in SKIPPED_TAGS:
+                pass
+            elif tag == "br":
+                run.append("\n")
+            elif note_kind(child) and not child.xpath(IMAGE_XPATH):
+                flush()
+                text = inner_text(child)
+                if text:
+                    blocks.append(["note", note_kind(child), NOTE_LABEL.sub("", text, count=1) or text])
+            elif tag in LIST_TAGS and not child.xpath(IMAGE_XPATH):
+                flush()
+                items = [inner_text(item) for item in child if tag_of(item) == "li"]
+                if any(items):
+                    blocks.append(["list", tag == "ol", [item for item in items if item]])
+            elif tag == "table" and not child.xpath(IMAGE_XPATH):
+                flush()
+                rows = [[inner_text(cell) for cell in row if tag_of(cell) in ("td", "th")]
+                        for row in child.iter("tr")]
+                rows = [row for row in rows if any(row)]
+                if len(rows) == 1 and len(rows[0]) == 1:
+                    # A one-cell layout table is just a box around text
+                    blocks.append(paragraph_block(rows[0][0]))
+                elif rows:
+                    blocks.append(["table", rows])
+            elif tag in BLOCK_TAGS or tag in ("td", "th") or has_blocks(child):
+                flush()
+                walk(child)
+                flush()
+            else:
+                run.append(inner_text(child) if tag else "")
+            if child.tail:
+                run.append(re.sub(r"\s+", " ", child.tail))
+
+    walk(body)
+    flush()
+    return blocks
+
+
+def inner_text_of_run(run):
+    # Pieces arrive with their whitespace collapsed; "\n" is a <br>
+    return "\n".join(line.strip() for line in "".join(run).split("\n")).strip()
+
+
+def extract_topic(html, topic_url):
+    document = lxml.html.fromstring(html)
+    body = document.find("body")
+    if body is None:
+        body = document
+
+    # Same extraction as the browser backend: headings are dropped (the
+    # manifest title is used instead) and images come from <object> tags
+    for heading in body.xpath(".//h1|.//h2|.//h3|.//h4|.//h5|.//h6"):
+        heading.drop_tree()
+
+    image_urls = [urljoin(topic_url, obj.get("data"))
+                  for obj in body.xpath(IMAGE_XPATH)]
+
+    return inner_text(body), image_urls, topic_blocks(body, len(image_urls))
+
+
+def topic_blocks(body, image_count):
+    # Every image gets a block, even one the walk did not place
+    blocks = extract_blocks(body)
+    placed = sum(1 for block in blocks if block[0] == "image")
+    return blocks + [["image", index] for index in range(placed, image_count)]
+
+
+def body_blocks(body_html, image_count):
+    # For the browser backend, which hands over the topic body's HTML with
+    # the headings already removed
+    return topic_blocks(lxml.html.fragment_fromstring(body_html, create_parent="body"), image_count)